@@ -0,0 +1,291 @@
+"""
+Offline benchmark suite for the matrix enumeration and the RSA chains.
+
+Every benchmark uses fixed seeds and synthetic inputs (no feature bank, no
+HOME datasets), runs `repeat` times and records the best and the median wall
+time. The results are written as JSON; with --baseline the run is compared
+to an earlier results file and the script exits with status 1 when a
+benchmark got slower than its threshold allows.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --baseline bench.json --threshold 0.1 --threshold "enumeration/*=0.2"
+    python benchmarks/run_benchmarks.py --quick --filter chain/
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "matrixes"))
+sys.path.append(os.path.join(ROOT, "dialogs", "golden_dialogs"))
+
+from benchmark_listener import synthetic_referent_set
+from generate_dialogs import GoldenDialogsGenerator
+from matrix_generator import MatrixGenerator
+from rational_agents import RationalListener, RationalSpeaker
+from rsa_engine import ArrayRSAEngine, RSAEngine
+
+RESULTS_VERSION = 1
+DEFAULT_THRESHOLD = 0.10
+
+
+def enumeration_benchmark(shape, method):
+    def run():
+        generator = MatrixGenerator(shape)
+        # silence the progress prints of the generators
+        with contextlib.redirect_stdout(io.StringIO()):
+            if method == "fast":
+                generator.generate_canonical_fast_fixed_first_row()
+            else:
+                generator.generate_canonical_orderly(packed=True)
+
+    return run
+
+
+def referent_sets(shape, num_sets, seed):
+    rng = random.Random(seed)
+    return [synthetic_referent_set(shape[0], shape[1], rng) for _ in range(num_sets)]
+
+
+def speaker_benchmark(shape, num_sets, seed):
+    sets = referent_sets(shape, num_sets, seed)
+
+    def run():
+        for referent_list in sets:
+            RationalSpeaker(referent_list, 0).first_ranked_target_feature()
+
+    return run
+
+
+def listener_benchmark(shape, num_sets, seed):
+    sets = referent_sets(shape, num_sets, seed)
+    heard = [RationalSpeaker(r, 0).first_ranked_target_feature() for r in sets]
+
+    def run():
+        for referent_list, feature in zip(sets, heard):
+            RationalListener(referent_list, feature).give_referent_set()
+
+    return run
+
+
+def engine_benchmark(shape, num_sets, seed, engine_class, all_targets):
+    sets = referent_sets(shape, num_sets, seed)
+
+    def run():
+        for referent_list in sets:
+            engine = engine_class(referent_list)
+            if all_targets:
+                engine.first_ranked_features()
+            else:
+                engine.first_ranked_target_position(0)
+
+    return run
+
+
+def chain_benchmark(shape, num_sets, seed):
+    sets = referent_sets(shape, num_sets, seed)
+
+    def run():
+        for referent_list in sets:
+            GoldenDialogsGenerator(referent_list, 0).generate_dialogue()
+
+    return run
+
+
+def all_targets_benchmark(shape, num_sets, seed):
+    sets = referent_sets(shape, num_sets, seed)
+
+    def run():
+        for referent_list in sets:
+            GoldenDialogsGenerator(referent_list, 0).generate_all_dialogues()
+
+    return run
+
+
+def recursive_chain_benchmark(shape, num_sets, seed, depth=2, alpha=1.0):
+    from recursive_rsa import RecursiveRSA
+
+    sets = referent_sets(shape, num_sets, seed)
+
+    def run():
+        # a new strategy every run, so that its engine cache starts empty
+        strategy = RecursiveRSA(depth, alpha)
+        for referent_list in sets:
+            GoldenDialogsGenerator(referent_list, 0, strategy=strategy).generate_all_dialogues()
+
+    return run
+
+
+def benchmark_cases(quick=False, seed=0):
+    """{name: setup} of every benchmark, setup() builds the inputs and returns the timed run"""
+    num_sets = 10 if quick else 50
+    enumeration_shapes = [(6, 4), (7, 5)] if quick else [(6, 4), (7, 5), (8, 5)]
+    fast_shapes = [(6, 4)] if quick else [(6, 4), (7, 4)]
+    rsa_shapes = [(8, 5), (12, 7)] if quick else [(8, 5), (12, 7), (16, 10)]
+    # the recursive RSA speaker needs numpy
+    numpy_available = importlib.util.find_spec("numpy") is not None
+
+    cases = {}
+    for rows, cols in enumeration_shapes:
+        cases[f"enumeration/orderly/{rows}x{cols}"] = (
+            lambda s=(rows, cols): enumeration_benchmark(s, "orderly")
+        )
+    for rows, cols in fast_shapes:
+        cases[f"enumeration/fast/{rows}x{cols}"] = (
+            lambda s=(rows, cols): enumeration_benchmark(s, "fast")
+        )
+    for rows, cols in rsa_shapes:
+        shape = (rows, cols)
+        cases[f"speaker/{rows}x{cols}"] = lambda s=shape: speaker_benchmark(s, num_sets, seed)
+        cases[f"listener/{rows}x{cols}"] = lambda s=shape: listener_benchmark(s, num_sets, seed)
+        cases[f"chain/{rows}x{cols}"] = lambda s=shape: chain_benchmark(s, num_sets, seed)
+        cases[f"chain_all_targets/{rows}x{cols}"] = (
+            lambda s=shape: all_targets_benchmark(s, num_sets, seed)
+        )
+        if numpy_available:
+            cases[f"chain_recursive/{rows}x{cols}"] = (
+                lambda s=shape: recursive_chain_benchmark(s, num_sets, seed)
+            )
+            # list vs array engine, for one target and for every referent (see rsa_engine.py)
+            for engine_class in (RSAEngine, ArrayRSAEngine):
+                for scope, all_targets in (("one", False), ("all", True)):
+                    cases[f"engine/{engine_class.__name__}/{scope}/{rows}x{cols}"] = (
+                        lambda s=shape, e=engine_class, a=all_targets: engine_benchmark(
+                            s, num_sets, seed, e, a
+                        )
+                    )
+    return cases
+
+
+def run_benchmarks(cases, repeat=3, name_filter=None):
+    """{name: {"seconds": best, "median": ..., "runs": [...]}}"""
+    results = {}
+    for name, setup in cases.items():
+        if name_filter and name_filter not in name:
+            continue
+        # the inputs are built outside of the timed runs
+        run = setup()
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            runs.append(time.perf_counter() - start)
+        results[name] = {"seconds": min(runs), "median": statistics.median(runs), "runs": runs}
+        print(f"{name:<28} {min(runs) * 1e3:10.2f} ms")
+    return results
+
+
+def parse_thresholds(values):
+    """['0.1', 'enumeration/*=0.2'] -> (default, [(pattern, threshold)])"""
+    default = DEFAULT_THRESHOLD
+    patterns = []
+    for value in values or []:
+        if "=" in value:
+            pattern, threshold = value.rsplit("=", 1)
+            patterns.append((pattern, float(threshold)))
+        else:
+            default = float(value)
+    return default, patterns
+
+
+def threshold_for(name, default, patterns):
+    """the last matching pattern wins"""
+    threshold = default
+    for pattern, value in patterns:
+        if fnmatch.fnmatch(name, pattern):
+            threshold = value
+    return threshold
+
+
+def compare_to_baseline(results, baseline, default=DEFAULT_THRESHOLD, patterns=()):
+    """
+    {name: {"baseline", "current", "ratio", "threshold", "regression"}} for the
+    benchmarks present in both; a regression is current > baseline * (1 + threshold)
+    """
+    comparison = {}
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["seconds"]
+        ratio = result["seconds"] / before if before > 0 else float("inf")
+        threshold = threshold_for(name, default, patterns)
+        comparison[name] = {
+            "baseline": before,
+            "current": result["seconds"],
+            "ratio": ratio,
+            "threshold": threshold,
+            "regression": ratio > 1 + threshold,
+        }
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    parser.add_argument("--baseline", default=None, help="results JSON to compare against")
+    parser.add_argument(
+        "--threshold",
+        action="append",
+        default=None,
+        help=f"allowed slowdown, e.g. 0.1 for all (default {DEFAULT_THRESHOLD}) "
+        "or 'chain/*=0.25' for the matching benchmarks; can be repeated",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark (best is kept)")
+    parser.add_argument("--filter", default=None, help="only run benchmarks whose name contains this")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        benchmark_cases(quick=args.quick, seed=args.seed),
+        repeat=args.repeat,
+        name_filter=args.filter,
+    )
+    report = {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+            "quick": args.quick,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        default, patterns = parse_thresholds(args.threshold)
+        comparison = compare_to_baseline(results, baseline, default, patterns)
+        report["comparison"] = comparison
+        print(f"\n{'benchmark':<28} {'baseline':>10} {'current':>10} {'ratio':>7}")
+        for name, row in comparison.items():
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(
+                f"{name:<28} {row['baseline'] * 1e3:8.2f}ms {row['current'] * 1e3:8.2f}ms "
+                f"{row['ratio']:6.2f}x{flag}"
+            )
+            if row["regression"]:
+                regressions.append(name)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"results saved to {args.output}")
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than allowed: {', '.join(regressions)}")
+        sys.exit(1)
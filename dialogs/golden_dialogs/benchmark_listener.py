@@ -0,0 +1,70 @@
+"""
+Benchmark the batched RationalListener against the per-referent listener
+(one RationalSpeaker per referent, looked up with referent_list.index)
+on synthetic referent sets.
+
+    python dialogs/golden_dialogs/benchmark_listener.py --shapes 8x5 12x7 16x10
+"""
+
+import argparse
+import random
+import time
+
+from rational_agents import RationalListener, RationalSpeaker
+
+
+def synthetic_referent_set(rows, cols, rng):
+    """distinct rows of a random 0/1 matrix, column j rendered as feature f{j}_{bit}"""
+    masks = rng.sample(range(2**cols), rows)
+    return [[f"f{j}_{(mask >> j) & 1}" for j in range(cols)] for mask in masks]
+
+
+def per_referent_listener(referent_list, heard_feature):
+    """the listener before batching: a new speaker for every referent"""
+    possible_referents = []
+    for referent in referent_list:
+        speaker = RationalSpeaker(referent_list, referent_list.index(referent))
+        if speaker.first_ranked_target_feature() == heard_feature:
+            possible_referents.append(referent)
+    return possible_referents
+
+
+def benchmark(shapes, num_sets=50, seed=0):
+    rng = random.Random(seed)
+    results = []
+    for rows, cols in shapes:
+        referent_sets = [synthetic_referent_set(rows, cols, rng) for _ in range(num_sets)]
+        heard = [
+            RationalSpeaker(referent_list, 0).first_ranked_target_feature()
+            for referent_list in referent_sets
+        ]
+
+        start = time.perf_counter()
+        expected = [per_referent_listener(r, f) for r, f in zip(referent_sets, heard)]
+        per_referent_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = [
+            RationalListener(r, f).give_referent_set() for r, f in zip(referent_sets, heard)
+        ]
+        batched_time = time.perf_counter() - start
+
+        assert batched == expected, f"batched listener differs on {rows}x{cols}"
+        results.append((rows, cols, per_referent_time / num_sets, batched_time / num_sets))
+        print(
+            f"{rows}x{cols}: per-referent {per_referent_time / num_sets * 1e3:.3f} ms, "
+            f"batched {batched_time / num_sets * 1e3:.3f} ms, "
+            f"speedup {per_referent_time / batched_time:.1f}x"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the batched RationalListener")
+    parser.add_argument("--shapes", nargs="+", default=["8x5", "12x7", "16x10"])
+    parser.add_argument("--num_sets", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    shapes = [tuple(int(x) for x in shape.split("x")) for shape in args.shapes]
+    benchmark(shapes, num_sets=args.num_sets, seed=args.seed)
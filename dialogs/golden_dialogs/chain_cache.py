@@ -0,0 +1,168 @@
+"""
+Structural cache for the golden dialogue chains.
+
+The rational speaker/listener chain of a referent set built from a 0/1 matrix
+depends only on the matrix and the target row, not on which feature pairs
+were sampled for the columns (as long as the 2 * cols feature words are all
+distinct). The cache solves each (matrix, target) once as an index chain
+(see GoldenDialogsGenerator.solve_chain) and the feature words are rendered
+per sample with GoldenDialogsGenerator.render_dialogue.
+
+A cache built with a speaker strategy (see GoldenDialogsGenerator) solves the
+chains with it and keys them with the strategy's name, so chains of different
+strategies can share one SQLite file.
+"""
+
+import json
+import sqlite3
+from collections import OrderedDict
+
+from generate_dialogs import GoldenDialogsGenerator
+
+
+def structural_referents(matrix):
+    """Referent list of a 0/1 matrix where column j contributes the feature 2 * j + value"""
+    return [[2 * j + value for j, value in enumerate(row)] for row in matrix]
+
+
+def words_match_structure(matrix, referent_list):
+    """True if different (column, value) cells of the matrix were mapped to different words"""
+    cell_of_word = {}
+    for row, referent in zip(matrix, referent_list):
+        for j, (value, word) in enumerate(zip(row, referent)):
+            if cell_of_word.setdefault(word, (j, value)) != (j, value):
+                return False
+    return True
+
+
+class ChainCache:
+    def __init__(self, maxsize=None, path=None, strategy=None):
+        """
+        maxsize: keep at most this many chains in memory (least recently used first out),
+                 None for no bound
+        path: SQLite file that persists the chains across runs, None to keep them in memory only
+        strategy: speaker strategy of GoldenDialogsGenerator (with a `name`), None for the default speaker
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self.strategy = strategy
+        self.key_suffix = "" if strategy is None else f":{strategy.name}"
+        self.chains = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        self._pending_writes = 0
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS chains (key TEXT PRIMARY KEY, chain TEXT NOT NULL)"
+            )
+
+    def make_key(self, matrix, target_index):
+        """e.g. '3x2:3-1-2:0', each row written as its bitmask, then the strategy's name if any"""
+        row_masks = [int("".join(str(value) for value in row), 2) for row in matrix]
+        return (
+            f"{len(matrix)}x{len(matrix[0])}:{'-'.join(map(str, row_masks))}:{target_index}"
+            f"{self.key_suffix}"
+        )
+
+    def solve(self, matrix, target_index=0):
+        """The index chain of a 0/1 matrix and target row, solved at most once"""
+        key = self.make_key(matrix, target_index)
+        chain = self.chains.get(key)
+        if chain is not None:
+            self.chains.move_to_end(key)
+            self.hits += 1
+            return chain
+
+        if self.db is not None:
+            row = self.db.execute("SELECT chain FROM chains WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                chain = tuple(
+                    (feature_position, tuple(indices))
+                    for feature_position, indices in json.loads(row[0])
+                )
+
+        if chain is None:
+            self.misses += 1
+            referents = structural_referents(matrix)
+            chain = GoldenDialogsGenerator(
+                referents, target_index, strategy=self.strategy
+            ).solve_chain()
+            self._persist(key, chain)
+        else:
+            self.hits += 1
+
+        self._remember(key, chain)
+        return chain
+
+    def solve_all(self, matrix):
+        """
+        The index chains of every target row of a 0/1 matrix, solved together
+        (see GoldenDialogsGenerator.solve_all_chains) unless all are in memory
+        """
+        keys = [self.make_key(matrix, target_index) for target_index in range(len(matrix))]
+        if all(key in self.chains for key in keys):
+            self.hits += len(keys)
+            for key in keys:
+                self.chains.move_to_end(key)
+            return [self.chains[key] for key in keys]
+
+        self.misses += len(keys)
+        chains = GoldenDialogsGenerator(
+            structural_referents(matrix), 0, strategy=self.strategy
+        ).solve_all_chains()
+        for key, chain in zip(keys, chains):
+            self._persist(key, chain)
+            self._remember(key, chain)
+        return chains
+
+    def _persist(self, key, chain):
+        if self.db is not None:
+            self.db.execute(
+                "INSERT OR REPLACE INTO chains VALUES (?, ?)", (key, json.dumps(chain))
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= 1000:
+                self.flush()
+
+    def _remember(self, key, chain):
+        self.chains[key] = chain
+        if self.maxsize is not None and len(self.chains) > self.maxsize:
+            self.chains.popitem(last=False)
+
+    def generate_dialogue(self, matrix, referent_list, target_index=0, vocabulary=None):
+        """
+        Same result as GoldenDialogsGenerator(referent_list, target_index, vocabulary).generate_dialogue(),
+        where referent_list (words, or feature ids with vocabulary) was mapped from matrix;
+        falls back to solving the words directly when two columns share a word
+        """
+        generator = GoldenDialogsGenerator(referent_list, target_index, vocabulary, self.strategy)
+        if words_match_structure(matrix, referent_list):
+            chain = self.solve(matrix, target_index)
+        else:
+            chain = generator.solve_chain()
+        return generator.render_dialogue(chain)
+
+    def generate_all_dialogues(self, matrix, referent_list, vocabulary=None):
+        """generate_dialogue for every target row, in row order"""
+        generator = GoldenDialogsGenerator(referent_list, 0, vocabulary, self.strategy)
+        if words_match_structure(matrix, referent_list):
+            chains = self.solve_all(matrix)
+        else:
+            chains = generator.solve_all_chains()
+        return [
+            generator.render_dialogue(chain, target_index)
+            for target_index, chain in enumerate(chains)
+        ]
+
+    def flush(self):
+        if self.db is not None:
+            self.db.commit()
+            self._pending_writes = 0
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
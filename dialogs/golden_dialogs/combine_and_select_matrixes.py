@@ -10,13 +10,19 @@ import random
 from pathlib import Path
 from typing import List, Dict, Any
 import argparse
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "matrixes"))
+from jsonl_stream import read_records
+from canonical import CanonicalIndex
+from matrix_store import MatrixStore
+
 HOME_DIR = os.getenv("HOME")
 
 
 def load_json_file(file_path: str) -> List[Dict[str, Any]]:
-    """Load JSON file"""
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """Load a JSON array file or a streamed JSONL(.gz/.zst) file"""
+    return list(read_records(file_path))
 
 
 def save_json_file(data: List[Dict[str, Any]], file_path: str):
@@ -55,11 +61,21 @@ def get_all_matrix_files(base_dir: str) -> Dict[int, List[str]]:
     return rounds_files
 
 
+def get_matrix_store_groups(store: MatrixStore) -> Dict[int, List[tuple]]:
+    """The (store, shape) groups of a matrix store, grouped by rounds like get_all_matrix_files"""
+    rounds_groups = {1: [], 2: [], 3: []}
+    for shape, rounds in sorted(store.counts()):
+        if rounds in rounds_groups:
+            rounds_groups[rounds].append((store, shape))
+    return rounds_groups
+
+
 def select_random_matrices(
-    rounds_files: Dict[int, List[str]], target_count: int = 300
+    rounds_files: Dict[int, List[str]], target_count: int = 300, dedupe: bool = False
 ) -> Dict[int, List[Dict[str, Any]]]:
-    """Randomly select matrices"""
+    """Randomly select matrices (equivalent matrices are only kept once if dedupe)"""
     selected_matrixes = {1: [], 2: [], 3: []}
+    seen = CanonicalIndex()
 
     for rounds, file_paths in rounds_files.items():
         print(f"\nProcessing rounds={rounds}...")
@@ -67,13 +83,22 @@ def select_random_matrices(
 
         all_matrixes = []
 
-        # load all matrices from all files
+        # load all matrices from all files (or from the store groups of these rounds)
         for file_path in file_paths:
-            matrixes = load_json_file(file_path)
+            if isinstance(file_path, tuple):
+                store, shape = file_path
+                matrixes = list(store.iter_records(shape=shape, rounds=rounds))
+                source = f"{shape} in {store.path}"
+            else:
+                matrixes = load_json_file(file_path)
+                source = os.path.basename(file_path)
             all_matrixes.extend(matrixes)
-            print(
-                f"  Loaded {len(matrixes)} matrixes from {os.path.basename(file_path)}"
-            )
+            print(f"  Loaded {len(matrixes)} matrixes from {source}")
+
+        if dedupe:
+            count = len(all_matrixes)
+            all_matrixes = list(seen.dedupe(all_matrixes))
+            print(f"Removed {count - len(all_matrixes)} duplicate matrixes")
 
         print(f"Total matrixes available for rounds={rounds}: {len(all_matrixes)}")
 
@@ -92,6 +117,47 @@ def select_random_matrices(
     return selected_matrixes
 
 
+def select_from_chain_indexes(
+    index_files: List[str],
+    target_count: int = 300,
+    target_row: int = 0,
+    seed: int = 42,
+    dedupe: bool = False,
+) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Select matrices by rounds from chain-length index files (see matrixes/chain_index.py);
+    with dedupe, (matrix, target) pairs equivalent to an earlier one are skipped
+    """
+    from chain_index import ChainIndex
+
+    candidates = {1: [], 2: [], 3: []}
+    for index_file in index_files:
+        index = ChainIndex.load(index_file)
+        print(f"Loaded {len(index)} indexed chains from {os.path.basename(index_file)}")
+        for rounds in candidates:
+            for row in index.query(rounds=rounds, target=target_row):
+                candidates[rounds].append((index, row))
+
+    rng = random.Random(seed)
+    selected_matrixes = {}
+    seen = CanonicalIndex()
+    for rounds, rows in candidates.items():
+        if dedupe:
+            count = len(rows)
+            rows = list(seen.dedupe(rows, matrix_of=lambda c: c[0].record(c[1])["matrix"]))
+            print(f"Removed {count - len(rows)} duplicate (matrix, target) pairs")
+        print(f"Total matrixes available for rounds={rounds}: {len(rows)}")
+        if len(rows) >= target_count:
+            rows = rng.sample(rows, target_count)
+        else:
+            print(
+                f"Warning: Only {len(rows)} matrixes available for rounds={rounds}, "
+                f"but {target_count} requested. Using all available."
+            )
+        selected_matrixes[rounds] = [index.record(row) for index, row in rows]
+    return selected_matrixes
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Randomly select matrices and combine them into a new JSON file"
@@ -108,7 +174,37 @@ def main():
         default=None,
         help="Output directory, default is test_selected_dialogs under base_dir",
     )
+    parser.add_argument(
+        "--index_files",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Chain-length index files (matrixes/chain_index.py); if given, select from them instead of base_dir",
+    )
+    parser.add_argument(
+        "--matrix_store",
+        type=str,
+        default=None,
+        help="Matrix store (matrixes/matrix_store.py) to select from instead of base_dir",
+    )
+    parser.add_argument(
+        "--output_store",
+        type=str,
+        default=None,
+        help="Also add the selected matrices to this matrix store, keyed by rounds",
+    )
+    parser.add_argument(
+        "--target_row",
+        type=int,
+        default=0,
+        help="Target row used with --index_files (moved to row 0 in the output)",
+    )
     parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Remove matrices equivalent (up to column permutations) to an earlier one before sampling",
+    )
     parser.add_argument(
         "--target_count",
         type=int,
@@ -134,19 +230,35 @@ def main():
 
     print("Start selecting matrices...")
 
-    # get all matrix files
-    rounds_files = get_all_matrix_files(str(base_dir))
+    if args.index_files:
+        selected_matrixes = select_from_chain_indexes(
+            args.index_files,
+            target_count=args.target_count,
+            target_row=args.target_row,
+            seed=args.seed,
+            dedupe=args.dedupe,
+        )
+    elif args.matrix_store:
+        with MatrixStore(args.matrix_store) as store:
+            selected_matrixes = select_random_matrices(
+                get_matrix_store_groups(store),
+                target_count=args.target_count,
+                dedupe=args.dedupe,
+            )
+    else:
+        # get all matrix files
+        rounds_files = get_all_matrix_files(str(base_dir))
 
-    # print found file information
-    for rounds, files in rounds_files.items():
-        print(f"Rounds {rounds}: {len(files)} files")
-        for file_path in files:
-            print(f"  - {os.path.basename(file_path)}")
+        # print found file information
+        for rounds, files in rounds_files.items():
+            print(f"Rounds {rounds}: {len(files)} files")
+            for file_path in files:
+                print(f"  - {os.path.basename(file_path)}")
 
-    # randomly select matrices
-    selected_matrixes = select_random_matrices(
-        rounds_files, target_count=args.target_count
-    )
+        # randomly select matrices
+        selected_matrixes = select_random_matrices(
+            rounds_files, target_count=args.target_count, dedupe=args.dedupe
+        )
 
     # save to three new JSON files
     for rounds, matrixes in selected_matrixes.items():
@@ -156,6 +268,13 @@ def main():
         else:
             print(f"No matrixes selected for rounds={rounds}")
 
+    # the pipelines can then read the selection through the store
+    if args.output_store:
+        with MatrixStore(args.output_store) as store:
+            for rounds, matrixes in selected_matrixes.items():
+                store.add(matrixes, rounds=rounds)
+        print(f"Added the selected matrixes to {args.output_store}")
+
     # print summary
     print("\n" + "=" * 50)
     print("Selection completed!")
@@ -0,0 +1,79 @@
+"""
+Interned feature vocabulary.
+
+The RSA computations only hash and compare the features of a referent
+(RSAEngine counts them, builds sets of them and tests membership), so a
+referent can be carried as an array of int ids instead of a list of words:
+two ids are equal exactly when the words are. Every word of the feature-pair
+bank gets an id once; MatrixMapping builds the referent sets as array("I")
+rows of ids, the speaker, the listener and GoldenDialogsGenerator work on the
+ids, and the words are looked up only when a dialogue or a referent string is
+written out.
+"""
+
+from array import array
+
+
+class FeatureVocabulary:
+    def __init__(self, words=()):
+        self.words = []
+        self.ids = {}
+        # filled by from_feature_pairs
+        self.pairs = None
+        self.pair_ids = []
+        self.first_ids = array("I")
+        self.second_ids = array("I")
+        for word in words:
+            self.intern(word)
+
+    @classmethod
+    def from_feature_pairs(cls, feature_pairs):
+        """
+        Vocabulary of a feature-pair bank ("big / small" per line);
+        pair_ids[i] are the ids of the features of feature_pairs[i], in order, and
+        first_ids[i] / second_ids[i] the same ids as two aligned arrays
+        """
+        vocabulary = cls()
+        vocabulary.pairs = feature_pairs
+        vocabulary.pair_ids = [
+            tuple(vocabulary.intern(word) for word in feature_pair.split(" / "))
+            for feature_pair in feature_pairs
+        ]
+        # a line without " / " has a single feature, used for both values
+        vocabulary.first_ids = array("I", [ids[0] for ids in vocabulary.pair_ids])
+        vocabulary.second_ids = array(
+            "I", [ids[min(1, len(ids) - 1)] for ids in vocabulary.pair_ids]
+        )
+        return vocabulary
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.ids
+
+    def intern(self, word):
+        """The id of word, added to the vocabulary if it is new"""
+        word_id = self.ids.get(word)
+        if word_id is None:
+            word_id = len(self.words)
+            self.ids[word] = word_id
+            self.words.append(word)
+        return word_id
+
+    def encode(self, referent):
+        """array of the ids of a referent's features"""
+        return array("I", [self.intern(word) for word in referent])
+
+    def decode(self, referent_ids):
+        """list of the feature words of a referent given as ids"""
+        words = self.words
+        return [words[word_id] for word_id in referent_ids]
+
+    def render(self, referent_ids):
+        """the referent as the space separated string used in the datasets"""
+        return " ".join(self.decode(referent_ids))
+
+    def parse(self, referent_string):
+        """ids of a space separated referent string"""
+        return self.encode(referent_string.split())
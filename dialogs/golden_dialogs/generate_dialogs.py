@@ -1,55 +1,156 @@
 from rational_agents import RationalSpeaker, RationalListener
+from feature_vocabulary import FeatureVocabulary
+from rsa_engine import engine_for_all_referents
+from rsa_state import RSAState, iter_rows
 import json
 
 # 这个文件用于生成golden dialogs的链条，并且将链条保存到文件中
 
 
 class GoldenDialogsGenerator:
-    def __init__(self, referent_list, target_index):
+    def __init__(self, referent_list, target_index, vocabulary=None, strategy=None):
         self.referent_list = referent_list
         self.target_index = target_index
+        # referent_list中的referent是特征id时, 输出时用vocabulary转换为词语
+        self.vocabulary = vocabulary
+        # speaker的策略: None为频率加权的S1 (RSAState / RSAEngine);
+        # 否则是 referent子集 -> engine 的函数 (如 recursive_rsa.RecursiveRSA(depth, alpha)),
+        # engine提供 first_ranked_target_position 和 first_ranked_features
+        self.strategy = strategy
         self.dialogue_chain = []
         
-    def generate_dialogue(self):
-        current_referent_set = self.referent_list.copy()
-        dialogue_chain = []
-        max_rounds = 10
-        round_count = 0
-
-        while round_count < max_rounds:
-            round_count += 1
-            speaker = RationalSpeaker(current_referent_set, self.target_index)
-            best_feature = speaker.first_ranked_target_feature()
-            listener = RationalListener(current_referent_set, best_feature)
-            possible_referents = listener.give_referent_set(current_referent_set)
-            dialogue_chain.append({
-                "speaker": best_feature,
-                "listener": possible_referents
-            })
-            
+    def solve_chain(self, max_rounds=10):
+        """
+        用下标表示的对话链条: 每一轮是 (speaker说的feature在target中的位置, listener保留的referent下标)
+        链条只依赖于referent_list的结构, 不依赖于具体的feature词语
+        """
+        if self.strategy is not None:
+            return self._solve_chain_with_strategy(max_rounds)
+
+        # 整个referent set上的RSA状态, 每一轮只减去listener排除的referent (见 rsa_state.py)
+        state = RSAState(self.referent_list)
+        target_index = self.target_index
+        chain = []
+
+        while len(chain) < max_rounds:
+            # speaker: target说rank最小的feature
+            feature_position = state.first_ranked_target_position(target_index)
+            best_feature = self.referent_list[target_index][feature_position]
+            # listener: 保留speaker会说best_feature的所有referent (行掩码)
+            kept_mask = state.listener_mask(best_feature)
+            kept = tuple(iter_rows(kept_mask))
+            chain.append((feature_position, kept))
+
             # 检查possible_referents中是否包含target_referent
-            target_referent = self.referent_list[self.target_index]
-            if target_referent not in possible_referents:
-                print(f"Warning: Target referent {target_referent} not in possible referents {possible_referents}")
+            if target_index not in kept:
+                possible_referents = [self.referent_list[i] for i in kept]
+                print(f"Warning: Target referent {self.referent_list[self.target_index]} not in possible referents {possible_referents}")
                 break
-            
-            if len(possible_referents) == 1:
+
+            if len(kept) == 1:
                 break
-            current_referent_set = possible_referents
+            state.filter(kept_mask)
+
+        return tuple(chain)
 
-        # 转换为字符串格式的对话
+    def _solve_chain_with_strategy(self, max_rounds):
+        """solve_chain, 每一轮在剩下的referent子集上用strategy创建engine"""
+        current_indices = list(range(len(self.referent_list)))
+        target_position = self.target_index
+        chain = []
+
+        while len(chain) < max_rounds:
+            subset = [self.referent_list[i] for i in current_indices]
+            engine = self.strategy(subset)
+            feature_position = engine.first_ranked_target_position(target_position)
+            best_feature = subset[target_position][feature_position]
+            kept = [p for p, f in enumerate(engine.first_ranked_features()) if f == best_feature]
+            chain.append((feature_position, tuple(current_indices[p] for p in kept)))
+
+            if len(kept) == 1:
+                break
+            target_position = kept.index(target_position)
+            current_indices = [current_indices[p] for p in kept]
+
+        return tuple(chain)
+
+    def subset_rounds(self, indices):
+        """
+        referent子集 (原referent_list的下标, 升序) 上的一轮: 对子集中的每个referent作为target,
+        返回 (speaker说的feature在target中的位置, listener保留的referent下标)
+        同一个子集只需要一个engine, 所有target共用
+        """
+        subset = [self.referent_list[i] for i in indices]
+        engine = engine_for_all_referents(subset) if self.strategy is None else self.strategy(subset)
+        positions = [engine.first_ranked_target_position(p) for p in range(len(subset))]
+        features = [subset[p][position] for p, position in enumerate(positions)]
+        # listener听到feature后保留的referent: speaker会说同一个feature的所有referent
+        kept_of_feature = {}
+        for p, feature in enumerate(features):
+            kept_of_feature.setdefault(feature, []).append(indices[p])
+        return [
+            (position, tuple(kept_of_feature[feature]))
+            for position, feature in zip(positions, features)
+        ]
+
+    def solve_all_chains(self, max_rounds=10):
+        """
+        所有target的对话链条, 第t个与 GoldenDialogsGenerator(referent_list, t).solve_chain() 相同
+        每一轮的referent子集上的计算按子集缓存, 走到同一个子集的target共用, 所以总计算量接近一条链条
+        """
+        all_indices = tuple(range(len(self.referent_list)))
+        rounds_by_subset = {}
+        chains = []
+        for target in all_indices:
+            current_indices = all_indices
+            chain = []
+            while len(chain) < max_rounds:
+                rounds = rounds_by_subset.get(current_indices)
+                if rounds is None:
+                    rounds = self.subset_rounds(current_indices)
+                    rounds_by_subset[current_indices] = rounds
+                feature_position, kept = rounds[current_indices.index(target)]
+                chain.append((feature_position, kept))
+                if len(kept) == 1:
+                    break
+                current_indices = kept
+            chains.append(tuple(chain))
+        return chains
+
+    def referent_words(self, referent):
+        """referent的特征词语列表"""
+        if self.vocabulary is None:
+            return referent
+        return self.vocabulary.decode(referent)
+
+    def render_dialogue(self, chain, target_index=None):
+        """把下标表示的对话链条转换为字符串格式的对话 (target_index默认为self.target_index)"""
+        if target_index is None:
+            target_index = self.target_index
+        referent_words = [self.referent_words(ref) for ref in self.referent_list]
+        target_referent = referent_words[target_index]
         dialogue_strings = []
-        for round_data in dialogue_chain:
-            dialogue_strings.append(f"Speaker: {round_data['speaker']}")
-            listener_str = ", ".join([f"('{', '.join(ref)}')" for ref in round_data['listener']])
+        for feature_position, indices in chain:
+            dialogue_strings.append(f"Speaker: {target_referent[feature_position]}")
+            listener_str = ", ".join([f"('{', '.join(referent_words[i])}')" for i in indices])
             dialogue_strings.append(f"Listener: {listener_str}")
 
         return {
-            "referent_set": [" ".join(ref) for ref in self.referent_list],
-            "target_referent": " ".join(self.referent_list[self.target_index]),
+            "referent_set": [" ".join(ref) for ref in referent_words],
+            "target_referent": " ".join(target_referent),
             "dialogue": dialogue_strings,
-            "rounds": len(dialogue_chain)
-        }    
+            "rounds": len(chain)
+        }
+
+    def generate_dialogue(self):
+        return self.render_dialogue(self.solve_chain())
+
+    def generate_all_dialogues(self):
+        """每个referent作为target的对话, 按referent顺序"""
+        return [
+            self.render_dialogue(chain, target_index)
+            for target_index, chain in enumerate(self.solve_all_chains())
+        ]
     
 
     
@@ -57,11 +158,12 @@ class GoldenDialogsGenerator:
         return self.referent_list[self.target_index]
     
     @staticmethod
-    def load_referent_sets_from_json(json_file_path):
+    def load_referent_sets_from_json(json_file_path, vocabulary=None):
         """
         从JSON文件加载referent sets并转换为referent_list格式
         参数:
         - json_file_path: str, JSON文件路径
+        - vocabulary: FeatureVocabulary, 给定时referent转换为特征id数组
         返回:
         - dict, 包含所有referent sets的字典，格式为 {set_name: referent_list}
         """
@@ -74,8 +176,11 @@ class GoldenDialogsGenerator:
             # 将字符串格式转换为列表格式
             referent_list = []
             for referent_str in referent_strings:
-                # 按空格分割字符串，得到特征列表
-                features = referent_str.split()
+                # 按空格分割字符串，得到特征列表 (或特征id数组)
+                if vocabulary is None:
+                    features = referent_str.split()
+                else:
+                    features = vocabulary.parse(referent_str)
                 referent_list.append(features)
             
             referent_sets[set_name] = referent_list
@@ -96,16 +201,17 @@ class GoldenDialogsGenerator:
         - dict, 包含所有对话的字典
         """
         # 加载所有referent sets
-        referent_sets = GoldenDialogsGenerator.load_referent_sets_from_json(json_file_path)
+        vocabulary = FeatureVocabulary()
+        referent_sets = GoldenDialogsGenerator.load_referent_sets_from_json(json_file_path, vocabulary)
         
         all_dialogues = {}
         
         for set_name, referent_list in referent_sets.items():
             print(f"\n=== Processing {set_name} ===")
-            print(f"Referent Set: {referent_list}")
+            print(f"Referent Set: {[vocabulary.decode(ref) for ref in referent_list]}")
             
             # 创建生成器并生成对话
-            generator = GoldenDialogsGenerator(referent_list, target_index)
+            generator = GoldenDialogsGenerator(referent_list, target_index, vocabulary)
             dialogue_chain = generator.generate_dialogue()
             
             # 打印轮数
@@ -5,9 +5,13 @@ from typing import List
 import argparse
 import os
 import random
+import sys
 import yaml
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "matrixes"))
+from jsonl_stream import read_records
+
 
 class DialoguePolisher:
     def __init__(
@@ -95,11 +99,11 @@ class DialoguePolisher:
             return []
 
     def polish_all_dialogues(
-        self, input_file: str, output_file: str, delay: float = 1.0
+        self, input_file: str, output_file: str, delay: float = 1.0, follow: bool = False
     ):
-        # Read the original data
-        with open(input_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        # Read the original data (JSON array, or JSONL read lazily; with follow the
+        # chains are polished while the pipeline is still writing them)
+        data = read_records(input_file, follow=follow)
 
         try:
             with open(output_file, "r", encoding="utf-8") as f:
@@ -108,7 +112,9 @@ class DialoguePolisher:
             polished_data = {}
 
         for idx, set_data in tqdm(
-            enumerate(data), total=len(data), desc="Polishing dialogues"
+            enumerate(data),
+            total=len(data) if isinstance(data, list) else None,
+            desc="Polishing dialogues",
         ):
             set_name = f"dialog_{idx}"
             # print(f">>> polishing {set_name}...")
@@ -150,7 +156,7 @@ def main():
     parser.add_argument(
         "--input_file",
         required=True,
-        help="Input JSON file path"
+        help="Input JSON or JSONL(.gz/.zst) file path"
     )
     parser.add_argument(
         "--output_file",
@@ -160,6 +166,11 @@ def main():
     parser.add_argument(
         "--prompt_dir", required=False, help="Prompt template directory path (optional)"
     )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep reading a JSONL input that is still being written",
+    )
     args = parser.parse_args()
 
     # Use args.input_file and args.output_file instead of hardcoded values
@@ -171,7 +182,7 @@ def main():
         config["base_url"],
         prompt_dir=args.prompt_dir,
     )
-    polisher.polish_all_dialogues(args.input_file, args.output_file)
+    polisher.polish_all_dialogues(args.input_file, args.output_file, follow=args.follow)
 
 
 if __name__ == "__main__":
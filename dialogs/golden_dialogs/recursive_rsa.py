@@ -0,0 +1,174 @@
+"""
+Recursive RSA engine with a rationality parameter.
+
+The rational speaker of rational_agents.py is one level of the Rational
+Speech Acts recursion over the lexicon M (M[r, f] = 1 if referent r has
+feature f), with a uniform prior:
+
+    L0(r | f) ∝ M[r, f]                      literal listener
+    Sk(f | r) ∝ L(k-1)(r | f) ** alpha         on r's features
+    Lk(r | f) ∝ Sk(f | r)                    pragmatic listener
+
+With alpha = 1, S1(f | r) = (1 / freq(f)) / sum over r's features of 1 / freq
+is the speaker's likelihood and L1 its posterior. RecursiveRSAEngine
+computes each level from the previous one as normalised (N, F) array
+operations, in log space so that large alpha values do not underflow, and
+caches every level. The speaker of depth k says the target's feature for
+which the target ranks best under Lk, ordered like the speaker's rank codes
+(rsa_engine.RankResult / rank_key); posteriors closer than `tolerance` (in
+log space) are ties, so depth 1 with alpha 1 is the speaker of rsa_engine
+except where its float posteriors split two equal values.
+
+RecursiveRSA(depth, alpha) is a strategy for GoldenDialogsGenerator and
+ChainCache: it builds the engine of a referent set and keeps the engines of
+the last `cache_size` sets. NumPy is needed by this module.
+"""
+
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # RecursiveRSAEngine raises an ImportError with install instructions
+    np = None
+
+from rsa_engine import TIE_ORDERS, RankResult, rank_key
+
+
+def _logsumexp(values, axis):
+    peak = values.max(axis=axis, keepdims=True)
+    peak = np.where(np.isfinite(peak), peak, 0.0)
+    with np.errstate(divide="ignore"):
+        return peak + np.log(np.exp(values - peak).sum(axis=axis, keepdims=True))
+
+
+class RecursiveRSAEngine:
+    def __init__(self, referent_list, depth=1, alpha=1.0, tie_order="legacy", tolerance=1e-9):
+        if np is None:
+            raise ImportError("the recursive RSA engine needs numpy (pip install numpy)")
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        if alpha <= 0:
+            raise ValueError("alpha must be positive")
+        if tie_order not in TIE_ORDERS:
+            raise ValueError(f"tie_order must be one of {TIE_ORDERS}")
+        self.referent_list = referent_list
+        self.num_referents = len(referent_list)
+        self.depth = depth
+        self.alpha = alpha
+        self.tie_order = tie_order
+        self.tolerance = tolerance
+
+        # columns in order of first appearance; positions[i][p]: column of referent i's p-th feature
+        self.feature_index = {}
+        for referent in referent_list:
+            for f in referent:
+                self.feature_index.setdefault(f, len(self.feature_index))
+        self.positions = [[self.feature_index[f] for f in r] for r in referent_list]
+        self.lexicon = np.zeros((self.num_referents, len(self.feature_index)), dtype=bool)
+        for i, columns in enumerate(self.positions):
+            self.lexicon[i, columns] = True
+
+        self._log_listeners = {}
+        self._log_speakers = {}
+        self._keys = None
+
+    def log_listener(self, level):
+        """log Lk(referent | feature) as an (N, F) array, -inf where the referent lacks the feature"""
+        table = self._log_listeners.get(level)
+        if table is None:
+            if level == 0:
+                with np.errstate(divide="ignore"):
+                    scores = np.log(self.lexicon.astype(float))
+            else:
+                scores = self.log_speaker(level)
+            # uniform prior: normalise every feature's column over the referents
+            table = scores - _logsumexp(scores, axis=0)
+            self._log_listeners[level] = table
+        return table
+
+    def log_speaker(self, level):
+        """log Sk(feature | referent) as an (N, F) array, -inf where the referent lacks the feature"""
+        table = self._log_speakers.get(level)
+        if table is None:
+            utility = self.alpha * self.log_listener(level - 1)
+            table = utility - _logsumexp(utility, axis=1)
+            self._log_speakers[level] = table
+        return table
+
+    def listener(self, level):
+        return np.exp(self.log_listener(level))
+
+    def speaker(self, level):
+        return np.exp(self.log_speaker(level))
+
+    def rank_column(self, feature):
+        """The RankResult of every referent under L(depth) for this feature"""
+        scores = self.log_listener(self.depth)[:, self.feature_index[feature]]
+        results = [None] * self.num_referents
+        present = np.flatnonzero(np.isfinite(scores))
+        # highest posterior first; a gap larger than the tolerance starts a new rank
+        order = present[np.argsort(-scores[present], kind="stable")]
+        groups = []
+        for i in order:
+            if groups and scores[groups[-1][-1]] - scores[i] <= self.tolerance:
+                groups[-1].append(i)
+            else:
+                groups.append([i])
+        for rank, group in enumerate(groups, 1):
+            for i in group:
+                results[i] = RankResult(rank, len(group))
+        absent = RankResult(len(groups) + 1, self.num_referents - len(present))
+        return [absent if result is None else result for result in results]
+
+    def _key_table(self):
+        if self._keys is None:
+            self._keys = {
+                feature: [
+                    rank_key(result, self.num_referents, self.tie_order)
+                    for result in self.rank_column(feature)
+                ]
+                for feature in self.feature_index
+            }
+        return self._keys
+
+    def first_ranked_target_position(self, target_index):
+        """Position, in the target's feature list, of its best ranked feature (the first one on ties)"""
+        keys = self._key_table()
+        target_keys = [keys[f][target_index] for f in self.referent_list[target_index]]
+        return target_keys.index(min(target_keys))
+
+    def first_ranked_target_feature(self, target_index):
+        target_object = self.referent_list[target_index]
+        return target_object[self.first_ranked_target_position(target_index)]
+
+    def first_ranked_features(self):
+        """The speaker's feature for every referent of the set, in referent order"""
+        return [self.first_ranked_target_feature(i) for i in range(self.num_referents)]
+
+
+class RecursiveRSA:
+    """GoldenDialogsGenerator strategy: the speaker of the given depth and rationality"""
+
+    def __init__(self, depth=1, alpha=1.0, tie_order="legacy", cache_size=1024):
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        if alpha <= 0:
+            raise ValueError("alpha must be positive")
+        self.depth = depth
+        self.alpha = alpha
+        self.tie_order = tie_order
+        self.cache_size = cache_size
+        self.name = f"rsa_depth{depth}_alpha{alpha:g}_{tie_order}"
+        self._engines = OrderedDict()
+
+    def __call__(self, referent_list):
+        key = tuple(tuple(r) for r in referent_list)
+        engine = self._engines.get(key)
+        if engine is None:
+            engine = RecursiveRSAEngine(referent_list, self.depth, self.alpha, self.tie_order)
+            self._engines[key] = engine
+            if len(self._engines) > self.cache_size:
+                self._engines.popitem(last=False)
+        else:
+            self._engines.move_to_end(key)
+        return engine
@@ -0,0 +1,219 @@
+"""
+Incidence-matrix engine behind the rational speaker.
+
+RationalSpeaker asks for P(referent | feature) one referent at a time, and
+every likelihood rebuilds the feature counts, so choosing one feature costs
+O(F * N^2 * F). The engine builds the feature counts and the per-referent
+normalisers once and fills whole posterior columns (one value per referent)
+with the same floating-point operations, in the same order, as the speaker.
+The ranks, including the ties encoded as float(f"{rank}.{same_count}"), are
+therefore identical to the original RationalSpeaker.
+
+RSAEngine fills the columns lazily, which is what a speaker with one target
+needs. ArrayRSAEngine builds the (referents x features) incidence matrix
+with NumPy and ranks every column at once, for the callers that need the
+speaker's choice for every referent (the listener, the all-targets solver).
+It keeps the same operations in the same order (the evidence is a
+sequential np.add.accumulate, not the pairwise np.sum), so its ranks are
+identical as well. Per referent set (benchmarks/run_benchmarks.py --filter engine/):
+
+    shape   RSAEngine (one target / all)   ArrayRSAEngine (one target / all)
+    8x5     69 / 153 us                    130 / 138 us
+    12x7    156 / 255 us                   210 / 170 us
+    16x10   287 / 469 us                   304 / 365 us
+
+so the speaker keeps RSAEngine and engine_for_all_referents picks
+ArrayRSAEngine when NumPy is installed.
+"""
+
+from collections import Counter
+from functools import lru_cache
+from typing import NamedTuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, engine_for_all_referents falls back to RSAEngine
+    np = None
+
+
+@lru_cache(maxsize=None)
+def rank_code(rank, same_count):
+    """The speaker's rank encoding: 2.0 for a unique rank 2, 2.3 when 3 referents tie"""
+    if same_count > 1:
+        return float(f"{rank}.{same_count}")
+    return float(rank)
+
+
+TIE_ORDERS = ("legacy", "count")
+
+
+class RankResult(NamedTuple):
+    """A rank as (rank, number of referents tied at it), for engines that do not use float codes"""
+
+    rank: int
+    tie_count: int
+
+    @property
+    def legacy_code(self):
+        """the float rank_code of this rank, e.g. 2.3"""
+        return rank_code(self.rank, self.tie_count)
+
+
+def rank_key(result, num_referents, tie_order="legacy"):
+    """
+    integer sort key of a RankResult in a set of num_referents referents, smaller is better;
+    tie_order="legacy" orders like rank_code (a 12-way tie before a 3-way tie of the same
+    rank, since 2.12 < 2.3), tie_order="count" puts the smaller tie first
+    """
+    if tie_order == "count":
+        return result.rank * (num_referents + 1) + result.tie_count
+    # legacy: the digits of the tie count after the decimal point (0 for no tie),
+    # padded to the width of the largest possible count
+    width = len(str(num_referents))
+    fraction = 0
+    if result.tie_count > 1:
+        fraction = result.tie_count * 10 ** (width - len(str(result.tie_count)))
+    return result.rank * 10**width + fraction
+
+
+class RSAEngine:
+    def __init__(self, referent_list):
+        self.referent_list = referent_list
+        self.num_referents = len(referent_list)
+        # feature frequencies over the whole referent set (with repetitions)
+        self.freq = Counter(f for r in referent_list for f in r)
+        inverse_freq = {f: 1 / count for f, count in self.freq.items()}
+        self.inverse_freq = inverse_freq
+        # incidence: the set of features of each referent
+        self.feature_sets = [set(r) for r in referent_list]
+        # normaliser of P(feature | referent): sum of 1 / freq over the referent's features
+        self.denominators = [sum(inverse_freq[f] for f in r) for r in referent_list]
+        self._posterior_columns = {}
+        self._rank_columns = {}
+
+    def likelihood_column(self, feature):
+        """P(feature | referent, referent_list) for every referent"""
+        if feature not in self.freq:
+            return [0.0] * self.num_referents
+        numerator = self.inverse_freq[feature]
+        return [
+            numerator / denominator if feature in features else 0.0
+            for features, denominator in zip(self.feature_sets, self.denominators)
+        ]
+
+    def posterior_column(self, feature):
+        """P(referent | feature, referent_list) for every referent, with a uniform prior"""
+        column = self._posterior_columns.get(feature)
+        if column is None:
+            likelihoods = self.likelihood_column(feature)
+            prior = 1 / self.num_referents
+            evidence = sum(likelihoods) * prior
+            column = [likelihood * prior / evidence for likelihood in likelihoods]
+            self._posterior_columns[feature] = column
+        return column
+
+    def rank_column(self, feature):
+        """The encoded rank of every referent's posterior for this feature"""
+        ranks = self._rank_columns.get(feature)
+        if ranks is None:
+            posteriors = self.posterior_column(feature)
+            counts = Counter(posteriors)
+            # rank 1 is the highest distinct posterior
+            rank_of = {
+                p: rank for rank, p in enumerate(sorted(counts, reverse=True), 1)
+            }
+            ranks = [rank_code(rank_of[p], counts[p]) for p in posteriors]
+            self._rank_columns[feature] = ranks
+        return ranks
+
+    def target_ranks(self, target_index):
+        """The encoded rank of the target for each of its features, in feature order"""
+        return [
+            self.rank_column(feature)[target_index]
+            for feature in self.referent_list[target_index]
+        ]
+
+    def first_ranked_target_position(self, target_index):
+        """Position, in the target's feature list, of its feature with the smallest rank"""
+        ranks = self.target_ranks(target_index)
+        return ranks.index(min(ranks))
+
+    def first_ranked_target_feature(self, target_index):
+        """The target's feature with the smallest rank (the first one on ties)"""
+        target_object = self.referent_list[target_index]
+        return target_object[self.first_ranked_target_position(target_index)]
+
+    def first_ranked_features(self):
+        """The speaker's feature for every referent of the set, in referent order"""
+        return [
+            self.first_ranked_target_feature(index)
+            for index in range(self.num_referents)
+        ]
+
+
+@lru_cache(maxsize=None)
+def rank_code_table(num_referents):
+    """table[rank, same_count] = rank_code(rank, same_count), as a NumPy array"""
+    table = np.zeros((num_referents + 2, num_referents + 1))
+    for rank in range(1, num_referents + 2):
+        for same_count in range(1, num_referents + 1):
+            table[rank, same_count] = rank_code(rank, same_count)
+    return table
+
+
+class ArrayRSAEngine(RSAEngine):
+    def __init__(self, referent_list):
+        if np is None:
+            raise ImportError("ArrayRSAEngine needs numpy (pip install numpy)")
+        super().__init__(referent_list)
+        # column j of the incidence matrix is the j-th distinct feature
+        self.feature_index = {f: j for j, f in enumerate(self.freq)}
+        self.positions = [[self.feature_index[f] for f in r] for r in referent_list]
+        incidence = np.zeros((self.num_referents, len(self.freq)), dtype=bool)
+        for i, columns in enumerate(self.positions):
+            incidence[i, columns] = True
+
+        inverse_freq = np.array([self.inverse_freq[f] for f in self.freq])
+        denominators = np.array(self.denominators)
+        likelihoods = np.where(incidence, inverse_freq[None, :] / denominators[:, None], 0.0)
+        prior = 1 / self.num_referents
+        # summed in referent order, like sum() over a likelihood column
+        evidence = np.add.accumulate(likelihoods, axis=0)[-1] * prior
+        self.likelihoods = likelihoods
+        self.posteriors = likelihoods * prior / evidence
+
+        # rank 1 is the highest distinct posterior of each column
+        order = np.argsort(-self.posteriors, axis=0, kind="stable")
+        ordered = np.take_along_axis(self.posteriors, order, axis=0)
+        new_value = np.ones(ordered.shape, dtype=np.intp)
+        new_value[1:] = ordered[1:] != ordered[:-1]
+        ranks = np.empty_like(new_value)
+        np.put_along_axis(ranks, order, np.cumsum(new_value, axis=0), axis=0)
+        same_counts = (self.posteriors[:, None, :] == self.posteriors[None, :, :]).sum(axis=1)
+        self.rank_codes = rank_code_table(self.num_referents)[ranks, same_counts]
+
+    def likelihood_column(self, feature):
+        if feature not in self.feature_index:
+            return super().likelihood_column(feature)
+        return self.likelihoods[:, self.feature_index[feature]].tolist()
+
+    def posterior_column(self, feature):
+        if feature not in self.feature_index:
+            return super().posterior_column(feature)
+        return self.posteriors[:, self.feature_index[feature]].tolist()
+
+    def rank_column(self, feature):
+        if feature not in self.feature_index:
+            return super().rank_column(feature)
+        return self.rank_codes[:, self.feature_index[feature]].tolist()
+
+    def first_ranked_target_position(self, target_index):
+        # argmin returns the first of equal ranks, like list.index(min(...))
+        return int(self.rank_codes[target_index, self.positions[target_index]].argmin())
+
+
+def engine_for_all_referents(referent_list):
+    """The faster engine when the speaker's choice is needed for every referent of the set"""
+    if np is None:
+        return RSAEngine(referent_list)
+    return ArrayRSAEngine(referent_list)
@@ -0,0 +1,152 @@
+"""
+Incremental RSA state over the rounds of one dialogue.
+
+Each round of a golden chain keeps a subset of the previous round's
+referents. Building a new RSAEngine on that subset recounts every feature
+and rebuilds every normaliser. RSAState is built once on the whole
+referent set and tracks the remaining rows as a bitmask (bit i is
+referent i):
+
+- filter(mask) subtracts the removed rows from the feature counts, in
+  O(removed rows * features);
+- only the rows sharing a feature with a removed row get their
+  normaliser (the sum of 1 / freq over their features) recomputed;
+- the posterior and rank tables are rebuilt lazily, per feature, for the
+  features that are asked for;
+- the listener (listener_mask) only checks the rows that contain the heard
+  feature, and stops at the first feature of a row that ranks before it.
+
+Every value is computed with the same floating-point operations, in the
+same order, as RSAEngine on the remaining referents (the zero likelihoods
+RSAEngine adds to its sums do not change them), so the ranks and the
+chains are identical.
+"""
+
+from collections import Counter
+
+from rsa_engine import rank_code
+
+
+def iter_rows(mask):
+    """indices of the set bits of mask, ascending"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class RSAState:
+    def __init__(self, referent_list):
+        self.referent_list = referent_list
+        self.alive = (1 << len(referent_list)) - 1
+        self.num_alive = len(referent_list)
+        # feature frequencies over the remaining referents (with repetitions)
+        self.freq = Counter(f for r in referent_list for f in r)
+        # rows_of_feature[f]: bitmask of the referents containing f
+        self.rows_of_feature = {}
+        for i, referent in enumerate(referent_list):
+            for f in referent:
+                self.rows_of_feature[f] = self.rows_of_feature.get(f, 0) | (1 << i)
+        self.denominators = [self._denominator(r) for r in referent_list]
+        self._posterior_columns = {}
+        self._rank_columns = {}
+
+    def _denominator(self, referent):
+        freq = self.freq
+        return sum(1 / freq[f] for f in referent)
+
+    def rows(self):
+        """indices of the remaining referents, ascending"""
+        return list(iter_rows(self.alive))
+
+    def filter(self, mask):
+        """keep only the referents whose bit is set in mask (a listener's kept set)"""
+        removed = self.alive & ~mask
+        if not removed:
+            return
+        self.alive &= mask
+        self.num_alive = bin(self.alive).count("1")
+
+        changed = set()
+        for i in iter_rows(removed):
+            for f in self.referent_list[i]:
+                self.freq[f] -= 1
+                changed.add(f)
+
+        # the normaliser of a row changes only if it contains a feature whose count changed
+        affected = 0
+        for f in changed:
+            affected |= self.rows_of_feature[f]
+        for i in iter_rows(affected & self.alive):
+            self.denominators[i] = self._denominator(self.referent_list[i])
+
+        # the prior 1 / num_alive changed, so every posterior does
+        self._posterior_columns.clear()
+        self._rank_columns.clear()
+
+    def posterior_column(self, feature):
+        """{row: P(row | feature)} for the remaining rows containing feature (the others are 0)"""
+        column = self._posterior_columns.get(feature)
+        if column is None:
+            rows = list(iter_rows(self.rows_of_feature.get(feature, 0) & self.alive))
+            numerator = 1 / self.freq[feature] if rows else 0.0
+            likelihoods = [numerator / self.denominators[i] for i in rows]
+            prior = 1 / self.num_alive
+            evidence = sum(likelihoods) * prior
+            column = {i: likelihood * prior / evidence for i, likelihood in zip(rows, likelihoods)}
+            self._posterior_columns[feature] = column
+        return column
+
+    def rank_column(self, feature):
+        """{row: encoded rank} for the remaining rows containing feature"""
+        ranks = self._rank_columns.get(feature)
+        if ranks is None:
+            posteriors = self.posterior_column(feature)
+            counts = Counter(posteriors.values())
+            # the zero posteriors of the other rows rank below all of these
+            rank_of = {p: rank for rank, p in enumerate(sorted(counts, reverse=True), 1)}
+            ranks = {i: rank_code(rank_of[p], counts[p]) for i, p in posteriors.items()}
+            self._rank_columns[feature] = ranks
+        return ranks
+
+    def first_ranked_target_position(self, target_index):
+        """Position, in the target's feature list, of its feature with the smallest rank"""
+        rank_columns = self._rank_columns
+        ranks = [
+            (rank_columns.get(f) or self.rank_column(f))[target_index]
+            for f in self.referent_list[target_index]
+        ]
+        return ranks.index(min(ranks))
+
+    def first_ranked_features(self):
+        """[(row, the speaker's feature for it)] for the remaining rows, ascending"""
+        return [
+            (i, self.referent_list[i][self.first_ranked_target_position(i)])
+            for i in iter_rows(self.alive)
+        ]
+
+    def listener_mask(self, heard_feature):
+        """bitmask of the remaining rows for which the speaker would say heard_feature"""
+        mask = 0
+        # only the rows containing heard_feature can say it
+        for i in iter_rows(self.rows_of_feature.get(heard_feature, 0) & self.alive):
+            if self._says(i, heard_feature):
+                mask |= 1 << i
+        return mask
+
+    def _says(self, i, feature):
+        """
+        referent_list[i][first_ranked_target_position(i)] == feature, stopping at the
+        first feature of the row that ranks before it
+        """
+        referent = self.referent_list[i]
+        position = referent.index(feature)
+        rank = self.rank_column(feature)[i]
+        rank_columns = self._rank_columns
+        for j, f in enumerate(referent):
+            if f == feature:
+                continue
+            other = (rank_columns.get(f) or self.rank_column(f))[i]
+            if other < rank or (other == rank and j < position):
+                return False
+        return True
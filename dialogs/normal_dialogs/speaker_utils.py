@@ -1,5 +1,10 @@
+import os
+import sys
 from collections import Counter
 
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "golden_dialogs"))
+from rsa_engine import RSAEngine
+
 def split_referent_object(referent_set):
     referent_list = [r.split() for r in referent_set]
     return referent_list
@@ -8,6 +13,7 @@ class SpeakerUtils:
     def __init__(self, referent_set, target_index):
         self.referent_list = split_referent_object(referent_set)
         self.target_index = target_index
+        self.engine = RSAEngine(self.referent_list)
 
     def get_freq(self):
         all_features = [f for r in self.referent_list for f in r]
@@ -20,14 +26,7 @@ class SpeakerUtils:
         说出某个特征的likelihood的概率
         P(feature | referent_object, referent_list)
         """
-        referent_object = self.referent_list[index]
-        if feature not in referent_object:
-            return 0.0
-        freq = self.get_freq()
-        numerator = 1 / freq[feature]
-        denominator = sum(1 / freq[f] for f in referent_object)
-        likelihood = numerator / denominator
-        return likelihood
+        return self.engine.likelihood_column(feature)[index]
 
     def feature_posterior_given_referent(self, feature, index)->float:
         """
@@ -35,52 +34,23 @@ class SpeakerUtils:
         那么说出某个feature词的posterior概率 
         P(referent_object | feature, referent_list)
         """
-        likelihood1 = self.feature_likelihood_given_referent(feature, index)
-        # 计算所有referent的likelihood
-        all_likelihood = [self.feature_likelihood_given_referent(feature, j) for j in range(len(self.referent_list))]
-        # # 计算所有referent的posterior只和,注意，这里要乘以object的数量的倒数！
-        prior = 1 / len(self.referent_list)
-        evidence = sum(all_likelihood)*prior
-        posterior = likelihood1 * prior / evidence
-        return posterior
+        # evidence 是所有referent的likelihood之和乘以object的数量的倒数
+        return self.engine.posterior_column(feature)[index]
 
     def posterior_list_given_feature(self, feature):
-        posterior_list = []
-        for i in range(len(self.referent_list)):
-            # 为每个referent计算posterior
-            posterior = self.feature_posterior_given_referent(feature, i)
-            posterior_list.append(posterior)
-        return posterior_list
+        return list(self.engine.posterior_column(feature))
     
     
     def target_object_rank_given_feature(self, feature):
-        posterior_list = self.posterior_list_given_feature(feature)
-        target_posterior = self.feature_posterior_given_referent(feature, self.target_index)
-        # 降序排序所有唯一posterior
-        sorted_unique = sorted(set(posterior_list), reverse=True)
-        # 找到target_posterior的排名（从1开始）
-        rank = sorted_unique.index(target_posterior) + 1
-        # 统计有多少个和target_posterior一样的
-        same_count = posterior_list.count(target_posterior)
-        if same_count > 1:
-            # 返回如2.2、2.3等格式
-            return float(f"{rank}.{same_count}")
-        else:
-            return float(rank)
+        # 降序排名（从1开始），并列时返回如2.2、2.3等格式
+        return self.engine.rank_column(feature)[self.target_index]
     
     def first_ranked_target_feature(self):
-        # 对于target object，遍历它所有的feature，并且分别调用target_object_rank_given_feature函数
-        # 然后把所有的rank依次放到一个list里
-        # 然后返回rank值最小的feature词语，而不是rank值
-        target_object = self.referent_list[self.target_index]
-        feature_rank_list = []
-        for feature in target_object:
-            rank = self.target_object_rank_given_feature(feature)
-            feature_rank_list.append(rank)
-        # print(feature_rank_list)
-        print("[DEBUG] the first ranked feature: ", target_object[feature_rank_list.index(min(feature_rank_list))])
+        # 返回rank值最小的feature词语，而不是rank值
+        feature = self.engine.first_ranked_target_feature(self.target_index)
+        print("[DEBUG] the first ranked feature: ", feature)
         print("[DEBUG] the present referent set: ", self.referent_list)
-        return target_object[feature_rank_list.index(min(feature_rank_list))]
+        return feature
 
 # 测试
 # print(SpeakerUtils(["old flat porous", "old flat dense", "old three-dimensional porous", "old three-dimensional dense", "new flat dense", "new three-dimensional porous", "new three-dimensional dense"], 0).first_ranked_target_feature())
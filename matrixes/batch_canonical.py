@@ -0,0 +1,146 @@
+"""
+Batched canonicalization of referent matrices with NumPy.
+
+canonical.canonicalize handles one matrix at a time in Python. Here a whole
+(B, rows, cols) uint8 array is canonicalized at once:
+
+- every row is packed into an integer key (column 0 is the most significant
+  bit, as in canonical.row_to_mask), and permuting the columns is the same as
+  permuting the bit weights, so the keys of every column permutation are one
+  matrix product with a (cols, cols!) weight table;
+- the keys of the rows after the first are sorted per permutation;
+- the lexicographically minimal (first row, sorted other rows) over the
+  permutations is selected column by column.
+
+The result is the same form as canonical.canonicalize: the first row stays
+first, so for matrices whose first row is all ones it is the form
+MatrixGenerator writes. Batches are split so that the key tensor stays under
+max_bytes. NumPy is only needed by this module.
+
+    python matrixes/batch_canonical.py --matrix_file matrixes_8x5.json
+"""
+
+import argparse
+import itertools
+import json
+import time
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only this module needs it
+    np = None
+
+MAX_BYTES = 1 << 28
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("batch canonicalization needs numpy (pip install numpy)")
+
+
+def permutation_weights(cols):
+    """(cols, cols!) table: column j of a row gets weight 2^(cols-1-perm^-1(j)) in permutation perm"""
+    _require_numpy()
+    if cols > 62:
+        raise ValueError("rows of more than 62 columns do not fit in an int64 key")
+    weights = 1 << np.arange(cols - 1, -1, -1, dtype=np.int64)
+    perms = np.array(list(itertools.permutations(range(cols))), dtype=np.intp)
+    table = np.empty((cols, len(perms)), dtype=np.int64)
+    # the permuted row is row[perm], so column perm[i] lands at position i
+    table[perms, np.arange(len(perms))[:, None]] = weights[None, :]
+    return table
+
+
+def pack_rows(matrices):
+    """(B, rows) int64 keys of a (B, rows, cols) 0/1 array"""
+    _require_numpy()
+    cols = matrices.shape[2]
+    weights = 1 << np.arange(cols - 1, -1, -1, dtype=np.int64)
+    return matrices.astype(np.int64) @ weights
+
+
+def unpack_rows(keys, cols):
+    """(B, rows, cols) uint8 array of (B, rows) int64 keys"""
+    shifts = np.arange(cols - 1, -1, -1, dtype=np.int64)
+    return ((keys[..., None] >> shifts) & 1).astype(np.uint8)
+
+
+def _canonical_keys_chunk(matrices, weights):
+    # keys[b, r, p]: key of row r of matrix b under permutation p
+    keys = matrices.astype(np.int64) @ weights
+    keys = np.concatenate([keys[:, :1, :], np.sort(keys[:, 1:, :], axis=1)], axis=1)
+
+    batch, rows, num_perms = keys.shape
+    alive = np.ones((batch, num_perms), dtype=bool)
+    best = np.empty((batch, rows), dtype=np.int64)
+    too_large = np.iinfo(np.int64).max
+    for r in range(rows):
+        column = np.where(alive, keys[:, r, :], too_large)
+        best[:, r] = column.min(axis=1)
+        alive &= column == best[:, r, None]
+    return best
+
+
+def canonical_keys(matrices, max_bytes=MAX_BYTES):
+    """(B, rows) int64 row keys of the canonical form of every matrix of a (B, rows, cols) array"""
+    _require_numpy()
+    matrices = np.asarray(matrices, dtype=np.uint8)
+    batch, rows, cols = matrices.shape
+    weights = permutation_weights(cols)
+    chunk = max(1, max_bytes // (rows * weights.shape[1] * 8 * 3))
+    result = np.empty((batch, rows), dtype=np.int64)
+    for start in range(0, batch, chunk):
+        result[start : start + chunk] = _canonical_keys_chunk(
+            matrices[start : start + chunk], weights
+        )
+    return result
+
+
+def batch_canonicalize(matrices, max_bytes=MAX_BYTES):
+    """Canonical form of every matrix of a (B, rows, cols) 0/1 array, as a (B, rows, cols) uint8 array"""
+    _require_numpy()
+    matrices = np.asarray(matrices, dtype=np.uint8)
+    return unpack_rows(canonical_keys(matrices, max_bytes), matrices.shape[2])
+
+
+def batch_is_canonical(matrices, max_bytes=MAX_BYTES):
+    """(B,) bool: is every matrix already in canonical form"""
+    _require_numpy()
+    matrices = np.asarray(matrices, dtype=np.uint8)
+    return np.all(canonical_keys(matrices, max_bytes) == pack_rows(matrices), axis=1)
+
+
+def verify_matrix_file(filename, max_bytes=MAX_BYTES):
+    """
+    Check a matrixes_RxC.json file ({matrix_name: matrix}): the names of the
+    matrices that are not canonical and of those equivalent to an earlier one
+    """
+    _require_numpy()
+    with open(filename, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    names = list(data)
+    matrices = np.array([data[name] for name in names], dtype=np.uint8)
+
+    keys = canonical_keys(matrices, max_bytes)
+    not_canonical = [
+        names[i] for i in np.flatnonzero(~np.all(keys == pack_rows(matrices), axis=1))
+    ]
+    _, first = np.unique(keys, axis=0, return_index=True)
+    is_first = np.zeros(len(names), dtype=bool)
+    is_first[first] = True
+    duplicates = [names[i] for i in np.flatnonzero(~is_first)]
+    return not_canonical, duplicates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Verify a matrix file with the batched canonicalization"
+    )
+    parser.add_argument("--matrix_file", required=True, help="matrixes_RxC.json file")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    not_canonical, duplicates = verify_matrix_file(args.matrix_file)
+    print(f"checked {args.matrix_file} in {time.time() - start_time:.2f} seconds")
+    print(f"{len(not_canonical)} matrices not in canonical form: {not_canonical[:10]}")
+    print(f"{len(duplicates)} matrices equivalent to an earlier one: {duplicates[:10]}")
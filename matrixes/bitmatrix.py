@@ -0,0 +1,118 @@
+"""
+Bit-packed representation of the referent matrices.
+
+Each row is a bitmask int with column 0 as the most significant bit (see
+canonical.py), so comparing masks is the same as comparing row tuples. A
+matrix is a tuple of row masks in row order, and for storage the whole
+matrix is packed into a single int with row 0 in the most significant bits.
+Collections of packed matrices are kept in an array('Q') (8 bytes per
+matrix) whenever rows * cols fits in 64 bits.
+"""
+
+import itertools
+import json
+from array import array
+
+from canonical import mask_to_row, row_to_mask
+
+
+class BitMatrixCodec:
+    def __init__(self, shape):
+        self.shape = shape
+        self.rows, self.cols = shape
+        self.full_row = (1 << self.cols) - 1
+        self._permutation_tables = {}
+
+    # ---- single rows and matrices ----
+
+    def encode_rows(self, matrix):
+        """Convert a matrix given as 0/1 rows to a tuple of row masks"""
+        return tuple(row_to_mask(row) for row in matrix)
+
+    def decode_rows(self, masks):
+        """Convert a tuple of row masks back to a list of 0/1 row tuples"""
+        return [mask_to_row(mask, self.cols) for mask in masks]
+
+    def pack(self, masks):
+        """Pack a tuple of row masks into a single int"""
+        code = 0
+        for mask in masks:
+            code = (code << self.cols) | mask
+        return code
+
+    def unpack(self, code):
+        """Unpack a single int back into a tuple of row masks"""
+        masks = []
+        for _ in range(self.rows):
+            masks.append(code & self.full_row)
+            code >>= self.cols
+        return tuple(reversed(masks))
+
+    def encode(self, matrix):
+        """Pack a matrix given as 0/1 rows into a single int"""
+        return self.pack(self.encode_rows(matrix))
+
+    def decode(self, code):
+        """Unpack a single int into a matrix of 0/1 rows"""
+        return self.decode_rows(self.unpack(code))
+
+    # ---- canonicalization helpers ----
+
+    def sort_rows(self, masks, keep_first=True):
+        """Sort the rows; by default the first row (the target) stays in place"""
+        if keep_first:
+            return (masks[0],) + tuple(sorted(masks[1:]))
+        return tuple(sorted(masks))
+
+    def permutation_table(self, perm):
+        """
+        Lookup table mapping every row mask to its image when column perm[j]
+        is moved to position j, cached per permutation
+        """
+        perm = tuple(perm)
+        table = self._permutation_tables.get(perm)
+        if table is None:
+            table = [
+                row_to_mask([row[i] for i in perm])
+                for row in itertools.product([0, 1], repeat=self.cols)
+            ]
+            self._permutation_tables[perm] = table
+        return table
+
+    def permute_columns(self, masks, perm):
+        """Apply a column permutation to every row of a matrix"""
+        table = self.permutation_table(perm)
+        return tuple(table[mask] for mask in masks)
+
+    # ---- collections and the matrixN JSON format ----
+
+    def new_array(self):
+        """Container for packed matrices: array('Q') when a matrix fits in 64 bits"""
+        if self.rows * self.cols <= 64:
+            return array("Q")
+        return []
+
+    def load_json(self, filename):
+        """Load a {"matrix1": [[...], ...], ...} file into packed matrices, keeping the order"""
+        with open(filename, "r", encoding="utf-8") as f:
+            matrices_dict = json.load(f)
+        return self.pack_all(matrices_dict.values())
+
+    def pack_all(self, matrices):
+        """Pack an iterable of 0/1 matrices into a packed collection"""
+        packed = self.new_array()
+        for matrix in matrices:
+            packed.append(self.encode(matrix))
+        return packed
+
+    def to_json_dict(self, packed):
+        """Convert packed matrices to the {"matrixN": matrix} layout of the JSON files"""
+        return {
+            f"matrix{i}": self.decode(code) for i, code in enumerate(packed, 1)
+        }
+
+    def save_json(self, packed, filename):
+        """Save packed matrices in the same format as MatrixGenerator.save_matrices_to_json"""
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.to_json_dict(packed), f, indent=2, ensure_ascii=False)
+
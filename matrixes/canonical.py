@@ -0,0 +1,286 @@
+"""
+Canonical-form primitives for the 0/1 referent matrices.
+
+A matrix is handled as a collection of distinct rows, each row stored as a
+bitmask int with column 0 as the most significant bit, so comparing two masks
+is the same as comparing the row tuples lexicographically. Two matrices are
+equivalent when one is a column permutation of the other (the row order does
+not matter), and the canonical representative of a class is the member whose
+ascending row tuple is lexicographically minimal. This is exactly the
+representative accepted by MatrixGenerator.is_canonical_fast_fixed_first_row.
+"""
+
+import math
+
+
+def row_to_mask(row):
+    """Convert a 0/1 row such as (1, 0, 1) to its bitmask (column 0 is the MSB)"""
+    mask = 0
+    for value in row:
+        mask = (mask << 1) | value
+    return mask
+
+
+def mask_to_row(mask, cols):
+    """Convert a bitmask back to a 0/1 row tuple of length cols"""
+    return tuple((mask >> (cols - 1 - j)) & 1 for j in range(cols))
+
+
+def _min_image(mask, cells):
+    """
+    Smallest image of a row under the column permutations allowed by an
+    ordered partition: inside every cell the zeros are moved to the front.
+    Each cell is a (column bitmask, cell size) pair.
+    """
+    image = 0
+    for cell, size in cells:
+        image = (image << size) | ((1 << (mask & cell).bit_count()) - 1)
+    return image
+
+
+def _refine(cells, mask):
+    """Split every cell into the columns where the row is 0 and where it is 1"""
+    refined = []
+    for cell, size in cells:
+        zeros = cell & ~mask
+        ones = cell & mask
+        if zeros and ones:
+            ones_size = ones.bit_count()
+            refined.append((zeros, size - ones_size))
+            refined.append((ones, ones_size))
+        else:
+            refined.append((cell, size))
+    return tuple(refined)
+
+
+def lex_min_rows(rows, cols, bound=None, cells=None):
+    """
+    Compute the lexicographically minimal ascending row tuple over all column
+    permutations, by partition refinement instead of trying all cols! orders.
+
+    The search keeps a set of ordered column partitions. The next canonical
+    row is the smallest image that any remaining row can take under any of
+    these partitions; every (partition, row) pair reaching it is refined and
+    kept, so ties branch and everything else is pruned.
+
+    If bound (an ascending row tuple) is given, the search stops and returns
+    None as soon as it proves that some permutation beats the bound.
+    If cells (an ordered partition) is given, only the column permutations
+    that keep its cells in place are considered.
+    """
+    n = len(rows)
+    if cells is None:
+        cells = (((1 << cols) - 1, cols),)
+    # each state is (ordered partition of the columns, bitmask of used rows)
+    states = [(cells, 0)]
+    form = []
+    for step in range(n):
+        best = None
+        candidates = []
+        for cells, used in states:
+            for idx in range(n):
+                if used >> idx & 1:
+                    continue
+                image = _min_image(rows[idx], cells)
+                if best is None or image < best:
+                    best = image
+                    candidates = [(cells, used, idx)]
+                elif image == best:
+                    candidates.append((cells, used, idx))
+
+        if bound is not None and best < bound[step]:
+            return None
+        form.append(best)
+
+        seen = set()
+        states = []
+        for cells, used, idx in candidates:
+            state = (_refine(cells, rows[idx]), used | (1 << idx))
+            if state not in seen:
+                seen.add(state)
+                states.append(state)
+
+    return tuple(form)
+
+
+def is_canonical_rows(rows, cols):
+    """Check if an ascending tuple of row masks is the canonical member of its class"""
+    return lex_min_rows(rows, cols, bound=rows) is not None
+
+
+def canonicalize(matrix):
+    """
+    Canonical form of a referent matrix given as 0/1 rows (as in the matrix
+    JSON files). The first row keeps its place, since it is the all-ones row
+    or the target row of a selected matrix, and becomes its smallest image;
+    the other rows become the lexicographically minimal ascending tuple under
+    the column permutations that keep that image. Two matrices get the same
+    form exactly when a column permutation and a reordering of the other rows
+    map one onto the other. When the first row is all ones this is the form
+    MatrixGenerator writes. Returns a tuple of row tuples.
+    """
+    cols = len(matrix[0])
+    first = row_to_mask(matrix[0])
+    all_columns = (((1 << cols) - 1, cols),)
+    rest = lex_min_rows(
+        sorted(row_to_mask(row) for row in matrix[1:]),
+        cols,
+        cells=_refine(all_columns, first),
+    )
+    form = (_min_image(first, all_columns),) + rest
+    return tuple(mask_to_row(mask, cols) for mask in form)
+
+
+def canonical_key(matrix):
+    """Hashable (rows, cols, packed canonical rows) key of a matrix"""
+    cols = len(matrix[0])
+    packed = 0
+    for row in canonicalize(matrix):
+        packed = (packed << cols) | row_to_mask(row)
+    return len(matrix), cols, packed
+
+
+class CanonicalIndex:
+    """Set of canonical keys, to deduplicate matrices up to column permutations"""
+
+    def __init__(self, matrices=()):
+        self.keys = set()
+        for matrix in matrices:
+            self.add(matrix)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, matrix):
+        return canonical_key(matrix) in self.keys
+
+    def add(self, matrix):
+        """Add a matrix, return True if no equivalent matrix was in the index"""
+        key = canonical_key(matrix)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+    def dedupe(self, items, matrix_of=lambda item: item["matrix"]):
+        """Yield the items whose matrix is new, in order (items are e.g. matrix records)"""
+        for item in items:
+            if self.add(matrix_of(item)):
+                yield item
+
+
+def iter_canonical_row_sets(cols, size, prefix=(), after=None, prune=None):
+    """
+    Orderly generation of the canonical sets of `size` distinct rows, drawn
+    from every row except the all-ones row (which is fixed as the first row
+    of the referent matrix and is invariant under column permutations).
+
+    Removing the largest row from a canonical set always leaves a canonical
+    set, so the sets are grown one row at a time (each new row larger than
+    the previous ones) and a branch is dropped as soon as it stops being
+    canonical. The sets are yielded in lexicographic order, which is the
+    order itertools.combinations visits them in the brute-force generator.
+
+    A canonical prefix (ascending row masks) restricts the generation to the
+    sets starting with it, which is how the enumeration is split into shards.
+    If after (a canonical set) is given, only the sets following it are
+    yielded, which is how an interrupted enumeration is resumed.
+    If prune(row_set) is given and returns True for a canonical prefix, the
+    sets extending that prefix are skipped.
+    """
+    candidates = list(range((1 << cols) - 1))
+    num_candidates = len(candidates)
+    if size > num_candidates:
+        return
+
+    start = prefix[-1] + 1 if prefix else 0
+    prefix = list(prefix)
+
+    def extend(start, on_after):
+        # on_after: the current prefix is a prefix of `after`
+        depth = len(prefix)
+        if depth == size:
+            if not on_after:
+                yield tuple(prefix)
+            return
+        if on_after:
+            start = max(start, after[depth])
+        # leave enough larger rows to fill the remaining positions
+        last = num_candidates - (size - depth) + 1
+        for idx in range(start, last):
+            prefix.append(candidates[idx])
+            if is_canonical_rows(prefix, cols) and (prune is None or not prune(prefix)):
+                yield from extend(idx + 1, on_after and idx == after[depth])
+            prefix.pop()
+
+    yield from extend(start, after is not None and tuple(after[: len(prefix)]) == tuple(prefix))
+
+
+def iter_canonical_children(parent, cols):
+    """
+    The canonical sets made of a canonical row set plus one larger row, in
+    lexicographic order. Every canonical set of size k + 1 is the child of
+    exactly one canonical set of size k (itself minus its largest row), so
+    extending all the canonical sets of size k, in order, gives all the
+    canonical sets of size k + 1, in order, without duplicates.
+    """
+    parent = tuple(parent)
+    if not is_canonical_rows(parent, cols):
+        raise ValueError(f"parent row set {parent} is not canonical")
+    start = parent[-1] + 1 if parent else 0
+    for row in range(start, (1 << cols) - 1):
+        child = parent + (row,)
+        if is_canonical_rows(child, cols):
+            yield child
+
+
+def canonical_prefixes(cols, size, depth):
+    """
+    The canonical prefixes of length depth that can still be extended to
+    `size` rows, in lexicographic order. Generating from each prefix in turn
+    gives the same sets, in the same order, as one full generation.
+    """
+    num_candidates = (1 << cols) - 1
+    for prefix in iter_canonical_row_sets(cols, depth):
+        # the largest row must leave enough larger rows for the remaining positions
+        if prefix[-1] + (size - depth) < num_candidates:
+            yield prefix
+
+
+def balanced_prefixes(cols, size, num_shards):
+    """
+    Canonical prefixes splitting the generation of the `size`-row sets into
+    at least num_shards subtrees, in lexicographic order (generating from
+    each in turn gives the same sets as one full generation).
+
+    The subtrees of short prefixes are very uneven (those starting with small
+    rows hold most of the sets), so instead of a fixed prefix length the
+    prefix with the largest subtree is replaced by its children until no
+    subtree is larger than 1 / num_shards of the total. The size of a subtree
+    is bounded by the number of combinations of the rows larger than the
+    prefix's last row.
+    """
+    num_candidates = (1 << cols) - 1
+
+    def bound(prefix):
+        if len(prefix) >= size - 1:
+            return 0  # the children would be complete sets
+        return math.comb(num_candidates - prefix[-1] - 1, size - len(prefix))
+
+    prefixes = list(canonical_prefixes(cols, size, 1))
+    bounds = [bound(prefix) for prefix in prefixes]
+    while prefixes:
+        largest = max(range(len(prefixes)), key=bounds.__getitem__)
+        if not bounds[largest] or (
+            len(prefixes) >= num_shards and bounds[largest] * num_shards <= sum(bounds)
+        ):
+            break
+        prefix = prefixes[largest]
+        children = [
+            child
+            for child in iter_canonical_children(prefix, cols)
+            if child[-1] + (size - len(child)) < num_candidates
+        ]
+        prefixes[largest : largest + 1] = children
+        bounds[largest : largest + 1] = [bound(child) for child in children]
+    return prefixes
@@ -0,0 +1,217 @@
+"""
+Uniform sampling of canonical referent matrices without enumerating them.
+
+A RxC referent matrix is the all-ones row plus a set X of R - 1 distinct rows
+drawn from the other 2^C - 1 rows; two matrices are the same class when a
+column permutation maps one row set onto the other. By Burnside's lemma the
+pairs (sigma, X) with sigma(X) = X contain exactly |S_C| = C! pairs for every
+class, so drawing such a pair uniformly and canonicalizing X gives every
+class the same probability.
+
+A uniform pair is drawn in three steps:
+1. a cycle type of S_C, weighted by (size of the conjugacy class) * Fix(type),
+   where Fix is the number of row sets fixed by one permutation of that type;
+2. the representative permutation of the type (conjugate permutations give
+   conjugate fixed sets, hence the same classes);
+3. a uniform fixed row set: sigma splits the rows into cycles, a fixed set is
+   a union of whole row cycles, and Fix is the coefficient of t^(R-1) in
+   prod over row cycles of (1 + t^len), so the set is drawn from that product
+   by dynamic programming.
+
+The counts are exact integers, so the number of classes (the number of
+matrices MatrixGenerator writes for the shape) is also available as
+CanonicalSampler.count().
+"""
+
+import argparse
+import bisect
+import math
+import random
+import time
+from collections import Counter
+
+from canonical import lex_min_rows, mask_to_row
+
+
+def cycle_types(n):
+    """All cycle types of S_n, as non-increasing tuples of cycle lengths"""
+
+    def partitions(remaining, largest):
+        if remaining == 0:
+            yield ()
+            return
+        for part in range(min(remaining, largest), 0, -1):
+            for rest in partitions(remaining - part, part):
+                yield (part,) + rest
+
+    return list(partitions(n, n))
+
+
+def class_size(cycle_type):
+    """Number of permutations of S_n with the given cycle type"""
+    n = sum(cycle_type)
+    denominator = 1
+    for length, multiplicity in Counter(cycle_type).items():
+        denominator *= length**multiplicity * math.factorial(multiplicity)
+    return math.factorial(n) // denominator
+
+
+def representative_permutation(cycle_type):
+    """perm[j] = image of column j, with the cycles on consecutive columns"""
+    perm = []
+    start = 0
+    for length in cycle_type:
+        perm.extend(start + (i + 1) % length for i in range(length))
+        start += length
+    return perm
+
+
+def row_cycles(perm):
+    """
+    Cycles of the rows (bitmasks) other than the all-ones row under a column
+    permutation, grouped by length: {length: [cycle, ...]}
+    """
+    cols = len(perm)
+    full_row = (1 << cols) - 1
+    # column j is bit (cols - 1 - j), as in canonical.row_to_mask
+    bit_images = [1 << (cols - 1 - perm[j]) for j in range(cols)]
+    seen = bytearray(full_row)
+    cycles = {}
+    for mask in range(full_row):
+        if seen[mask]:
+            continue
+        cycle = []
+        current = mask
+        while not seen[current]:
+            seen[current] = 1
+            cycle.append(current)
+            image = 0
+            for j in range(cols):
+                if current >> (cols - 1 - j) & 1:
+                    image |= bit_images[j]
+            current = image
+        cycles.setdefault(len(cycle), []).append(cycle)
+    return cycles
+
+
+class _FixedSets:
+    """Row cycles of one permutation and the number of fixed row sets of each size"""
+
+    def __init__(self, perm, size):
+        self.size = size
+        self.groups = sorted(row_cycles(perm).items())
+        # ways[g][s]: row sets of size s made of whole cycles of groups g, g + 1, ...
+        ways = [[0] * (size + 1) for _ in range(len(self.groups) + 1)]
+        ways[-1][0] = 1
+        for g in range(len(self.groups) - 1, -1, -1):
+            length, cycles = self.groups[g]
+            following = ways[g + 1]
+            for s in range(size + 1):
+                total = 0
+                for m in range(min(len(cycles), s // length) + 1):
+                    total += math.comb(len(cycles), m) * following[s - m * length]
+                ways[g][s] = total
+        self.ways = ways
+        self.count = ways[0][size]
+
+    def sample(self, rng):
+        """A uniformly random fixed row set of the given size (unsorted row masks)"""
+        rows = []
+        remaining = self.size
+        for g, (length, cycles) in enumerate(self.groups):
+            if remaining == 0:
+                break
+            following = self.ways[g + 1]
+            r = rng.randrange(self.ways[g][remaining])
+            for m in range(min(len(cycles), remaining // length) + 1):
+                weight = math.comb(len(cycles), m) * following[remaining - m * length]
+                if r < weight:
+                    break
+                r -= weight
+            for cycle in rng.sample(cycles, m):
+                rows.extend(cycle)
+            remaining -= m * length
+        return rows
+
+
+class CanonicalSampler:
+    def __init__(self, shape, seed=None):
+        """
+        shape: (rows, cols) of the referent matrices, the first row is all ones
+        seed: seed of the sampler's random.Random
+        """
+        self.shape = tuple(shape)
+        rows, cols = self.shape
+        self.size = rows - 1
+        self.rng = random.Random(seed)
+        if not 0 <= self.size <= 2**cols - 1:
+            raise ValueError(f"no {rows}x{cols} matrix has {rows} distinct rows")
+
+        self.types = []
+        self.cumulative_weights = []
+        total = 0
+        for cycle_type in cycle_types(cols):
+            fixed_sets = _FixedSets(representative_permutation(cycle_type), self.size)
+            weight = class_size(cycle_type) * fixed_sets.count
+            if weight == 0:
+                continue
+            total += weight
+            self.types.append((cycle_type, fixed_sets))
+            self.cumulative_weights.append(total)
+        self.total_weight = total
+
+    def count(self):
+        """Exact number of canonical matrices of the shape (Burnside's lemma)"""
+        return self.total_weight // math.factorial(self.shape[1])
+
+    def sample_row_set(self):
+        """The canonical row masks (ascending, without the all-ones row) of a uniform class"""
+        r = self.rng.randrange(self.total_weight)
+        _, fixed_sets = self.types[bisect.bisect_right(self.cumulative_weights, r)]
+        rows = sorted(fixed_sets.sample(self.rng))
+        return lex_min_rows(rows, self.shape[1])
+
+    def sample(self):
+        """A uniformly random canonical matrix, as lists of 0/1 with the all-ones row first"""
+        cols = self.shape[1]
+        row_set = self.sample_row_set()
+        return [[1] * cols] + [list(mask_to_row(mask, cols)) for mask in row_set]
+
+    def sample_many(self, count):
+        return [self.sample() for _ in range(count)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sample canonical matrices uniformly over their classes"
+    )
+    parser.add_argument("--rows", type=int, default=16, help="Number of rows")
+    parser.add_argument("--cols", type=int, default=10, help="Number of columns")
+    parser.add_argument("--count", type=int, default=1000, help="Number of samples")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--output", default=None, help="JSONL file to write the samples to (matrix_name, matrix)"
+    )
+    args = parser.parse_args()
+
+    start_time = time.time()
+    sampler = CanonicalSampler((args.rows, args.cols), seed=args.seed)
+    print(
+        f"{args.rows}x{args.cols}: {sampler.count()} canonical matrices, "
+        f"setup {time.time() - start_time:.2f} seconds"
+    )
+
+    start_time = time.time()
+    if args.output:
+        from jsonl_stream import JSONLWriter
+
+        with JSONLWriter(args.output) as writer:
+            for i in range(args.count):
+                writer.write({"matrix_name": f"sample{i + 1}", "matrix": sampler.sample()})
+    else:
+        sampler.sample_many(args.count)
+    elapsed = time.time() - start_time
+    print(
+        f"sampled {args.count} matrices in {elapsed:.2f} seconds "
+        f"({args.count / max(elapsed, 1e-9):.0f} per second)"
+    )
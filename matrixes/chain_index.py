@@ -0,0 +1,310 @@
+"""
+Chain-length index of the canonical matrices.
+
+For every matrix of a matrixes_RxC file and every possible target row, the
+index stores the number of rounds of the rational dialogue chain and the
+size of the listener's candidate set after each round. Selecting matrices
+of a given difficulty is then a query on the index instead of generating a
+dialogue per matrix (mapping.process_all_matrices) and bucketing the files.
+
+The index is a columnar binary file: a JSON header line describing the
+columns, followed by the raw arrays (matrix id, target row, rounds,
+candidate set size per round, and the matrix as one column of row masks per
+row, so that shapes over 64 cells such as 12x7 fit as well).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # ChainIndex.query falls back to scanning the columns in Python
+    np = None
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "dialogs", "golden_dialogs")
+)
+from bitmatrix import BitMatrixCodec
+from chain_cache import structural_referents
+from generate_dialogs import GoldenDialogsGenerator
+
+MAX_ROUNDS = 10
+INDEX_VERSION = 2
+# the target and candidate set size columns are unsigned bytes
+MAX_ROWS = 255
+MAX_COLS = 64
+# fixed-width unsigned typecodes ("L" is 4 bytes on Windows and 8 elsewhere)
+ROW_MASK_TYPECODES = (("B", 8), ("H", 16), ("I", 32), ("Q", 64))
+
+
+def row_mask_typecode(cols):
+    """smallest unsigned array typecode holding a row mask of cols bits"""
+    for typecode, bits in ROW_MASK_TYPECODES:
+        if cols <= bits:
+            assert array(typecode).itemsize * 8 == bits, f"array({typecode!r}) is not {bits} bits"
+            return typecode
+    raise ValueError(f"rows of {cols} columns do not fit in 64 bits")
+
+
+def chain_statistics(matrix, target_index):
+    """(rounds, candidate set size after each round) of the chain of a 0/1 matrix"""
+    chain = GoldenDialogsGenerator(structural_referents(matrix), target_index).solve_chain(
+        max_rounds=MAX_ROUNDS
+    )
+    return len(chain), [len(indices) for _, indices in chain]
+
+
+def _index_worker(task):
+    shape, codes = task
+    codec = BitMatrixCodec(shape)
+    results = []
+    for code in codes:
+        matrix = codec.decode(code)
+        results.append([chain_statistics(matrix, t) for t in range(len(matrix))])
+    return results
+
+
+def load_packed_matrices(filename):
+    """(shape, packed matrices) of a matrixN JSON file or of a streamed JSONL file, in order"""
+    if filename.endswith(".jsonl"):
+        with open(filename, "r", encoding="utf-8") as f:
+            matrices = (json.loads(line)["matrix"] for line in f)
+            first = next(matrices)
+            codec = BitMatrixCodec((len(first), len(first[0])))
+            packed = codec.pack_all([first])
+            for matrix in matrices:
+                packed.append(codec.encode(matrix))
+        return codec.shape, packed
+
+    with open(filename, "r", encoding="utf-8") as f:
+        matrices = list(json.load(f).values())
+    codec = BitMatrixCodec((len(matrices[0]), len(matrices[0][0])))
+    return codec.shape, codec.pack_all(matrices)
+
+
+class ChainIndex:
+    def __init__(self, shape, data=None):
+        self.shape = tuple(shape)
+        rows, cols = self.shape
+        if rows > MAX_ROWS or cols > MAX_COLS:
+            raise ValueError(
+                f"the chain index holds at most {MAX_ROWS} rows of {MAX_COLS} columns, got {rows}x{cols}"
+            )
+        self.codec = BitMatrixCodec(self.shape)
+        self.columns = [
+            ("matrix_id", "I"),
+            ("target", "B"),
+            ("rounds", "B"),
+        ] + [(f"size_{r}", "B") for r in range(1, MAX_ROUNDS + 1)] + [
+            (f"row_{i}", row_mask_typecode(cols)) for i in range(rows)
+        ]
+        self.data = data or {name: array(typecode) for name, typecode in self.columns}
+
+    def __len__(self):
+        return len(self.data["matrix_id"])
+
+    @classmethod
+    def build(cls, matrix_file, workers=1, chunk_size=256):
+        """Solve the chain of every (matrix, target row) of a matrixes_RxC file"""
+        shape, packed = load_packed_matrices(matrix_file)
+        index = cls(shape)
+        tasks = [
+            (index.shape, packed[start : start + chunk_size])
+            for start in range(0, len(packed), chunk_size)
+        ]
+        print(f"indexing {len(packed)} matrices x {shape[0]} target rows...")
+
+        if workers > 1:
+            pool = multiprocessing.Pool(workers)
+            results = pool.imap(_index_worker, tasks)
+        else:
+            pool = None
+            results = map(_index_worker, tasks)
+
+        matrix_id = 0
+        for task, chunk in zip(tasks, results):
+            for code, per_target in zip(task[1], chunk):
+                matrix_id += 1  # ids follow the matrixN names
+                for target, (rounds, sizes) in enumerate(per_target):
+                    index.append(matrix_id, target, rounds, sizes, code)
+            print(f"indexed {matrix_id}/{len(packed)} matrices")
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+        return index
+
+    def append(self, matrix_id, target, rounds, sizes, code):
+        self.data["matrix_id"].append(matrix_id)
+        self.data["target"].append(target)
+        self.data["rounds"].append(rounds)
+        for r in range(1, MAX_ROUNDS + 1):
+            self.data[f"size_{r}"].append(sizes[r - 1] if r <= len(sizes) else 0)
+        for i, mask in enumerate(self.codec.unpack(code)):
+            self.data[f"row_{i}"].append(mask)
+
+    def save(self, filename):
+        header = {
+            "version": INDEX_VERSION,
+            "shape": list(self.shape),
+            "num_rows": len(self),
+            "byteorder": sys.byteorder,
+            "columns": [[name, typecode] for name, typecode in self.columns],
+        }
+        with open(filename, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            for name, _ in self.columns:
+                self.data[name].tofile(f)
+        print(f"chain index saved to {filename} ({len(self)} rows)")
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            header = json.loads(f.readline())
+            data = {}
+            for name, typecode in header["columns"]:
+                column = array(typecode)
+                column.fromfile(f, header["num_rows"])
+                if header["byteorder"] != sys.byteorder:
+                    column.byteswap()
+                data[name] = column
+        if header["version"] == 1:
+            # version 1 stored the packed matrix in one 64-bit column
+            codec = BitMatrixCodec(tuple(header["shape"]))
+            masks = [codec.unpack(code) for code in data.pop("matrix")]
+            index = cls(header["shape"])
+            for i in range(index.shape[0]):
+                data[f"row_{i}"] = array(
+                    row_mask_typecode(index.shape[1]), (m[i] for m in masks)
+                )
+            index.data = data
+            return index
+        return cls(header["shape"], data)
+
+    def matrix(self, row):
+        """The 0/1 matrix of an index row"""
+        return self.codec.decode_rows(
+            [self.data[f"row_{i}"][row] for i in range(self.shape[0])]
+        )
+
+    def candidate_sizes(self, row):
+        """Candidate set size after each round of an index row"""
+        return [self.data[f"size_{r}"][row] for r in range(1, self.data["rounds"][row] + 1)]
+
+    def query(self, rounds=None, target=None, final_size=None):
+        """Index rows matching the given number of rounds, target row and final candidate set size"""
+        if np is None:
+            return self._query_columns(rounds, target, final_size)
+
+        # the byte columns are viewed as NumPy arrays without copying
+        column = lambda name: np.frombuffer(self.data[name], dtype=np.uint8)
+        selected = np.ones(len(self), dtype=bool)
+        if rounds is not None:
+            selected &= column("rounds") == rounds
+        if target is not None:
+            selected &= column("target") == target
+        if final_size is not None:
+            sizes = np.stack([column(f"size_{r}") for r in range(1, MAX_ROUNDS + 1)])
+            last = column("rounds").astype(np.intp) - 1
+            selected &= sizes[last, np.arange(len(self))] == final_size
+        return np.flatnonzero(selected).tolist()
+
+    def _query_columns(self, rounds=None, target=None, final_size=None):
+        """query() without NumPy: each condition filters the rows left by the previous one"""
+        rows = range(len(self))
+        if rounds is not None:
+            rows = [row for row, value in enumerate(self.data["rounds"]) if value == rounds]
+        if target is not None:
+            column = self.data["target"]
+            rows = [row for row in rows if column[row] == target]
+        if final_size is not None:
+            column = self.data["rounds"]
+            rows = [row for row in rows if self.data[f"size_{column[row]}"][row] == final_size]
+        return list(rows)
+
+    def record(self, row, target_first=True):
+        """
+        A selected (matrix, target) in the format of the selected matrix files.
+        With target_first the target row is moved to the front, since the chain
+        does not depend on the row order and the pipelines use row 0 as target.
+        """
+        matrix = self.matrix(row)
+        target = self.data["target"][row]
+        if target_first:
+            matrix = [matrix[target]] + matrix[:target] + matrix[target + 1 :]
+        return {
+            "matrix_name": f"matrix{self.data['matrix_id'][row]}",
+            "target_row": target,
+            "matrix": [list(r) for r in matrix],
+            "rounds": self.data["rounds"][row],
+            "candidate_sizes": self.candidate_sizes(row),
+        }
+
+    def select(self, count, rounds=None, target=None, seed=42):
+        """Randomly select up to count (matrix, target) records matching the query"""
+        rows = self.query(rounds=rounds, target=target)
+        if len(rows) > count:
+            rows = sorted(random.Random(seed).sample(rows, count))
+        return [self.record(row) for row in rows]
+
+    def summary(self):
+        """{target: {rounds: number of matrices}}"""
+        counts = {}
+        for target, rounds in zip(self.data["target"], self.data["rounds"]):
+            per_target = counts.setdefault(target, {})
+            per_target[rounds] = per_target.get(rounds, 0) + 1
+        return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the chain-length index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="index a matrixes_RxC file")
+    build_parser.add_argument("--matrix_file", required=True, help="matrixes_RxC.json(l) file")
+    build_parser.add_argument("--output", required=True, help="index file to write")
+    build_parser.add_argument("--workers", type=int, default=1)
+
+    select_parser = subparsers.add_parser("select", help="select matrices by difficulty")
+    select_parser.add_argument("--index", nargs="+", required=True, help="index files")
+    select_parser.add_argument("--rounds", type=int, required=True)
+    select_parser.add_argument(
+        "--target", type=int, default=0, help="target row (-1 for any row)"
+    )
+    select_parser.add_argument("--count", type=int, default=300)
+    select_parser.add_argument("--seed", type=int, default=42)
+    select_parser.add_argument("--output", required=True, help="JSON file to write")
+
+    summary_parser = subparsers.add_parser("summary", help="count matrices per rounds")
+    summary_parser.add_argument("--index", required=True)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        ChainIndex.build(args.matrix_file, workers=args.workers).save(args.output)
+    elif args.command == "select":
+        target = None if args.target < 0 else args.target
+        records = []
+        for index_file in args.index:
+            index = ChainIndex.load(index_file)
+            for record in index.select(
+                args.count, rounds=args.rounds, target=target, seed=args.seed
+            ):
+                record["shape"] = f"{index.shape[0]}x{index.shape[1]}"
+                records.append(record)
+        if len(records) > args.count:
+            records = random.Random(args.seed).sample(records, args.count)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        print(f"selected {len(records)} matrices with {args.rounds} rounds to {args.output}")
+    else:
+        index = ChainIndex.load(args.index)
+        for target, per_rounds in sorted(index.summary().items()):
+            print(f"target row {target}: " + ", ".join(
+                f"{rounds} rounds: {count}" for rounds, count in sorted(per_rounds.items())
+            ))
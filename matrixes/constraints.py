@@ -0,0 +1,111 @@
+"""
+Constraints evaluated while MatrixGenerator enumerates canonical matrices.
+
+Instead of enumerating every canonical matrix, generating a dialogue for each
+(mapping.process_all_matrices) and keeping the ones with the wanted chain
+length, the orderly generator asks a MatrixConstraints object at every node
+of its search tree whether the branch can still produce a wanted matrix
+(prune) and at every complete matrix whether it is wanted (accept).
+
+The rows of a branch are added in ascending bitmask order, so a property that
+no larger row can change any more is decided before the branch is expanded:
+column j is dominated by column k (every row with a 1 in j has a 1 in k) until
+some row has a 1 in j and a 0 in k, and all the rows that can still be added
+are larger than the branch's largest row. The chain properties are not
+monotone in the rows and are checked on complete matrices with the
+structural chain solver.
+"""
+
+from canonical import mask_to_row
+from chain_index import MAX_ROUNDS, chain_statistics
+
+
+def unbroken_dominations(row_set, cols):
+    """
+    broken[p]: bitmask of the bit positions q such that some row has a 1 at
+    bit p and a 0 at bit q (so the column at bit p is not dominated by q)
+    """
+    full_row = (1 << cols) - 1
+    broken = [0] * cols
+    for row in row_set:
+        zeros = full_row & ~row
+        for p in range(cols):
+            if row >> p & 1:
+                broken[p] |= zeros
+    return broken
+
+
+class MatrixConstraints:
+    def __init__(
+        self,
+        rounds=None,
+        unique_target=False,
+        no_dominated_columns=False,
+        target_row=0,
+    ):
+        """
+        rounds: keep the matrices whose rational chain has exactly this many rounds
+        unique_target: keep the matrices whose chain ends with the target as the only candidate
+        no_dominated_columns: drop the matrices where the ones of a column are a subset
+                              of the ones of another column
+        target_row: row of the target (0 is the all-ones row, as in the pipelines)
+        """
+        if rounds is not None and not 1 <= rounds <= MAX_ROUNDS:
+            raise ValueError(f"rounds must be between 1 and {MAX_ROUNDS}")
+        self.rounds = rounds
+        self.unique_target = unique_target
+        self.no_dominated_columns = no_dominated_columns
+        self.target_row = target_row
+
+    def __bool__(self):
+        return self.rounds is not None or self.unique_target or self.no_dominated_columns
+
+    def describe(self):
+        """e.g. '2rounds_unique' or '2rounds_nodominated_target3', used in the output file names"""
+        parts = []
+        if self.rounds is not None:
+            parts.append(f"{self.rounds}rounds")
+        if self.unique_target:
+            parts.append("unique")
+        if self.no_dominated_columns:
+            parts.append("nodominated")
+        # the chain filters depend on the target row (row 0 keeps the previous names)
+        if self.target_row != 0 and (self.rounds is not None or self.unique_target):
+            parts.append(f"target{self.target_row}")
+        return "_".join(parts)
+
+    def prune(self, row_set, cols):
+        """True if no canonical matrix extending row_set (ascending, without the all-ones row) is wanted"""
+        if not self.no_dominated_columns or not row_set:
+            return False
+        full_row = (1 << cols) - 1
+        largest = row_set[-1]
+        broken = unbroken_dominations(row_set, cols)
+        for p in range(cols):
+            for q in range(cols):
+                if p == q or broken[p] >> q & 1:
+                    continue
+                # only the rows with a 1 at p and a 0 at q can break "p dominated by q";
+                # the largest of them is full_row ^ (1 << q), and later rows are larger
+                if largest >= full_row ^ (1 << q):
+                    return True
+        return False
+
+    def accept(self, row_set, cols):
+        """True if the matrix [all-ones row] + row_set satisfies every constraint"""
+        if self.no_dominated_columns:
+            broken = unbroken_dominations(row_set, cols)
+            full_row = (1 << cols) - 1
+            if any(broken[p] | (1 << p) != full_row for p in range(cols)):
+                return False
+
+        if self.rounds is not None or self.unique_target:
+            matrix = [(1,) * cols] + [mask_to_row(mask, cols) for mask in row_set]
+            if self.target_row >= len(matrix):
+                return False
+            rounds, sizes = chain_statistics(matrix, self.target_row)
+            if self.rounds is not None and rounds != self.rounds:
+                return False
+            if self.unique_target and (not sizes or sizes[-1] != 1):
+                return False
+        return True
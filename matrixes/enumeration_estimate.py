@@ -0,0 +1,208 @@
+"""
+Predict the size and the run time of a MatrixGenerator enumeration.
+
+The number of canonical matrices of a shape is the number of orbits of the
+(rows - 1)-row sets under the column permutations, computed exactly with
+Burnside's lemma (see canonical_sampler.py).
+
+The orderly search tree has one node per canonical row set of each size d,
+and expanding a node tries every larger row. CanonicalSampler draws canonical
+sets of size d uniformly, so timing the expansion of a few sampled nodes per
+depth and multiplying by the exact number of nodes at that depth gives an
+unbiased estimate of the whole run. The fast method checks every row
+combination, so its estimate is the number of combinations times the mean
+time of a check on random combinations.
+
+    python matrixes/enumeration_estimate.py count --shapes 8x5 12x6
+    python matrixes/enumeration_estimate.py estimate --shapes 9x5 --calibration_seconds 5
+    python matrixes/enumeration_estimate.py schedule --shapes 9x5 8x6 12x5
+"""
+
+import argparse
+import contextlib
+import io
+import math
+import random
+import time
+
+from canonical import is_canonical_rows
+from canonical_sampler import CanonicalSampler
+from matrix_generator import MatrixGenerator
+
+# samples per depth of the calibration, whatever its time budget
+MIN_SAMPLES = 5
+MAX_SAMPLES = 2000
+
+
+def count_canonical_matrices(shape):
+    """Exact number of canonical matrices MatrixGenerator produces for a (rows, cols) shape"""
+    rows, cols = shape
+    if rows - 1 > 2**cols - 1:
+        return 0
+    return CanonicalSampler(shape).count()
+
+
+def _expand(parent, cols, size):
+    """The canonicity tests of the orderly search at one node (see iter_canonical_row_sets)"""
+    num_candidates = (1 << cols) - 1
+    last = num_candidates - (size - len(parent)) + 1
+    start = parent[-1] + 1 if parent else 0
+    for row in range(start, last):
+        is_canonical_rows(parent + (row,), cols)
+
+
+def _timed_mean(run, budget, rng):
+    """Mean time of run(rng) over MIN_SAMPLES..MAX_SAMPLES calls, within about budget seconds"""
+    total = 0.0
+    samples = 0
+    while samples < MIN_SAMPLES or (total < budget and samples < MAX_SAMPLES):
+        total += run(rng)
+        samples += 1
+    return total / samples, samples
+
+
+def estimate_enumeration(shape, method="orderly", calibration_seconds=2.0, seed=0):
+    """
+    {"shape", "method", "matrices", "predicted_seconds", "calibration_samples"} for
+    enumerating a shape with MatrixGenerator (one worker)
+    """
+    rows, cols = shape
+    size = rows - 1
+    matrices = count_canonical_matrices(shape)
+    rng = random.Random(seed)
+    if matrices == 0:
+        return {
+            "shape": f"{rows}x{cols}",
+            "method": method,
+            "matrices": 0,
+            "predicted_seconds": 0.0,
+            "calibration_samples": 0,
+        }
+
+    if method == "orderly":
+        predicted = 0.0
+        calibration_samples = 0
+        budget = calibration_seconds / size
+        for depth in range(size):
+            sampler = CanonicalSampler((depth + 1, cols), seed=rng.randrange(2**32))
+
+            def run(_rng):
+                parent = sampler.sample_row_set()
+                start = time.perf_counter()
+                _expand(parent, cols, size)
+                return time.perf_counter() - start
+
+            mean, samples = _timed_mean(run, budget, rng)
+            predicted += sampler.count() * mean
+            calibration_samples += samples
+    elif method == "fast":
+        num_candidates = 2**cols - 1
+        generator = MatrixGenerator(shape)
+        first_row = (1,) * cols
+        all_rows = [
+            row for row in (tuple(int(b) for b in f"{m:0{cols}b}") for m in range(2**cols))
+            if row != first_row
+        ]
+
+        def run(rng):
+            indices = sorted(rng.sample(range(num_candidates), size))
+            matrix = [first_row] + [all_rows[i] for i in indices]
+            start = time.perf_counter()
+            generator.is_canonical_fast_fixed_first_row(matrix)
+            return time.perf_counter() - start
+
+        mean, calibration_samples = _timed_mean(run, calibration_seconds, rng)
+        predicted = math.comb(num_candidates, size) * mean
+    else:
+        raise ValueError(f"unknown method {method}")
+
+    return {
+        "shape": f"{rows}x{cols}",
+        "method": method,
+        "matrices": matrices,
+        "predicted_seconds": predicted,
+        "calibration_samples": calibration_samples,
+    }
+
+
+def schedule_by_cost(shapes, method="orderly", calibration_seconds=1.0, seed=0):
+    """Estimates of the shapes, cheapest first (the order a sweep scheduler should run them)"""
+    estimates = [
+        estimate_enumeration(shape, method, calibration_seconds, seed) for shape in shapes
+    ]
+    return sorted(estimates, key=lambda estimate: estimate["predicted_seconds"])
+
+
+def measure_enumeration(shape, method="orderly"):
+    """Actual run time of the enumeration, to check an estimate"""
+    generator = MatrixGenerator(shape)
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if method == "fast":
+            matrices = generator.generate_canonical_fast_fixed_first_row()
+        else:
+            matrices = generator.generate_canonical_orderly(packed=True)
+    return len(matrices), time.time() - start
+
+
+def _format_seconds(seconds):
+    if seconds < 120:
+        return f"{seconds:.1f} s"
+    if seconds < 7200:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Predict the number of canonical matrices and the enumeration time"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in [
+        ("count", "exact number of canonical matrices (Burnside's lemma)"),
+        ("estimate", "number of matrices and predicted enumeration time"),
+        ("schedule", "estimates ordered from the cheapest shape to the most expensive"),
+    ]:
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("--shapes", nargs="+", required=True, help="e.g. 8x5 12x6")
+        if name != "count":
+            subparser.add_argument("--method", choices=["orderly", "fast"], default="orderly")
+            subparser.add_argument(
+                "--calibration_seconds",
+                type=float,
+                default=2.0,
+                help="time spent timing sampled search nodes per shape",
+            )
+            subparser.add_argument("--seed", type=int, default=0)
+        if name == "estimate":
+            subparser.add_argument(
+                "--measure",
+                action="store_true",
+                help="also run the enumeration and print the actual time",
+            )
+    args = parser.parse_args()
+
+    shapes = [tuple(int(x) for x in shape.split("x")) for shape in args.shapes]
+    if args.command == "count":
+        for shape in shapes:
+            print(f"{shape[0]}x{shape[1]}: {count_canonical_matrices(shape)} canonical matrices")
+    else:
+        if args.command == "schedule":
+            estimates = schedule_by_cost(
+                shapes, args.method, args.calibration_seconds, args.seed
+            )
+        else:
+            estimates = [
+                estimate_enumeration(shape, args.method, args.calibration_seconds, args.seed)
+                for shape in shapes
+            ]
+        for estimate in estimates:
+            line = (
+                f"{estimate['shape']}: {estimate['matrices']} canonical matrices, "
+                f"predicted {_format_seconds(estimate['predicted_seconds'])} ({estimate['method']})"
+            )
+            if args.command == "estimate" and args.measure:
+                shape = tuple(int(x) for x in estimate["shape"].split("x"))
+                _, elapsed = measure_enumeration(shape, args.method)
+                line += f", measured {_format_seconds(elapsed)}"
+            print(line)
@@ -0,0 +1,146 @@
+"""
+Feature-pair bank with a word-level conflict graph.
+
+Two feature pairs conflict when they share a word ("big / small" and
+"small / tiny"): mapped to two columns of the same matrix they give referents
+that cannot be told apart by that word. The bank splits every pair once
+(see FeatureVocabulary), builds the conflict graph once as compact arrays
+(offsets + neighbors, one entry per pair) and samples pairs so that no two
+sampled pairs conflict. Pairs whose two features are the same word are
+never sampled.
+
+Sampling keeps a permutation of the usable pairs; a pick is a uniformly
+random entry among the first `size` ones, and the picked pair and its
+neighbors are swapped behind the boundary (and swapped back once the sample
+is complete, so a sample only depends on the random state). Each pick is uniform over the
+pairs that do not conflict with the earlier picks, there is no rejection
+and a sample of k pairs costs O(k + their number of conflicts). A bank
+without conflicts samples with rng.sample, the same draws as sampling the
+plain list of pairs.
+
+The bank only holds arrays and is built once: build it before forking the
+workers (or pass it as a Pool initializer argument) and they share it.
+
+    python matrixes/feature_bank.py --feature_pairs_file feature_pairs_bank_01.txt
+"""
+
+import argparse
+import os
+import random
+import sys
+from array import array
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "dialogs", "golden_dialogs")
+)
+from feature_vocabulary import FeatureVocabulary
+
+
+class FeatureBank:
+    def __init__(self, feature_pairs):
+        self.pairs = feature_pairs
+        self.vocabulary = FeatureVocabulary.from_feature_pairs(feature_pairs)
+
+        # pairs containing each word
+        pairs_of_word = {}
+        for index, ids in enumerate(self.vocabulary.pair_ids):
+            for word_id in set(ids):
+                pairs_of_word.setdefault(word_id, []).append(index)
+
+        # conflict graph: neighbors[offsets[i]:offsets[i + 1]] are the pairs sharing a word with i
+        self.offsets = array("I", [0])
+        self.neighbors = array("I")
+        usable = array("I")
+        for index, ids in enumerate(self.vocabulary.pair_ids):
+            conflicts = set()
+            for word_id in set(ids):
+                conflicts.update(pairs_of_word[word_id])
+            conflicts.discard(index)
+            self.neighbors.extend(sorted(conflicts))
+            self.offsets.append(len(self.neighbors))
+            # "small / small" or a line without " / " cannot map both values of a column
+            if len(ids) == 2 and ids[0] != ids[1]:
+                usable.append(index)
+
+        self.usable = usable
+        self.num_conflicts = len(self.neighbors) // 2
+        self._pool = None
+        self._position = None
+
+    @classmethod
+    def load(cls, file_path):
+        """bank of a feature pairs file, one "a / b" pair per line (blank lines are skipped)"""
+        with open(file_path, "r") as file:
+            return cls([line.strip() for line in file if line.strip()])
+
+    def __len__(self):
+        return len(self.pairs)
+
+    @property
+    def has_conflicts(self):
+        return self.num_conflicts > 0 or len(self.usable) < len(self.pairs)
+
+    def conflicts(self, index):
+        """indices of the pairs sharing a word with pair index"""
+        return self.neighbors[self.offsets[index] : self.offsets[index + 1]]
+
+    def sample(self, k, rng=None):
+        """k pair indices, no two of them sharing a word"""
+        rng = rng or random
+        if not self.has_conflicts:
+            return rng.sample(range(len(self.pairs)), k)
+
+        if self._pool is None:
+            # written by every sample, so created on first use in each process;
+            # the pairs that are not usable stay at a position past the pool
+            self._pool = array("I", self.usable)
+            self._position = array("I", [len(self.pairs)]) * len(self.pairs)
+            for position, index in enumerate(self._pool):
+                self._position[index] = position
+        position = self._position
+        pool = self._pool
+        size = len(pool)
+
+        selected = []
+        swaps = []
+        try:
+            while len(selected) < k:
+                if size == 0:
+                    raise ValueError(f"fewer than {k} feature pairs without a shared word")
+                index = pool[rng.randrange(size)]
+                selected.append(index)
+                for removed in (index, *self.conflicts(index)):
+                    p = position[removed]
+                    if p >= size:  # not usable, or already removed
+                        continue
+                    size -= 1
+                    self._swap(p, size)
+                    swaps.append(p)
+        finally:
+            # undo the swaps, so that the draws only depend on rng and not on earlier samples
+            for p in reversed(swaps):
+                size += 1
+                self._swap(p, size - 1)
+        return selected
+
+    def _swap(self, p, q):
+        pool = self._pool
+        position = self._position
+        pool[p], pool[q] = pool[q], pool[p]
+        position[pool[p]] = p
+        position[pool[q]] = q
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check a feature pairs file for shared words")
+    parser.add_argument("--feature_pairs_file", required=True, help="feature pairs file path")
+    args = parser.parse_args()
+
+    bank = FeatureBank.load(args.feature_pairs_file)
+    print(f"{len(bank)} feature pairs, {len(bank.vocabulary)} distinct words")
+    print(f"{len(bank) - len(bank.usable)} pairs not usable (same word twice or no ' / ')")
+    print(f"{bank.num_conflicts} pairs of feature pairs sharing a word")
+    for index in range(len(bank)):
+        conflicts = bank.conflicts(index)
+        if len(conflicts):
+            print(f"  {bank.pairs[index]!r} shares a word with {[bank.pairs[i] for i in conflicts]}")
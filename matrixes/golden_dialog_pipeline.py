@@ -1,9 +1,16 @@
 # dialogue_pipeline.py
 import random
+import hashlib
+import itertools
 import json
+import multiprocessing
 import os
 import argparse
+import glob
+import mapping
 from mapping import MatrixMapping
+from jsonl_stream import JSONLWriter, with_codec_suffix
+from matrix_store import MatrixStore
 from tqdm import tqdm
 
 parser = argparse.ArgumentParser(
@@ -13,106 +20,275 @@ parser.add_argument(
     "--feature_pairs_file", required=True, help="feature pairs file path"
 )
 parser.add_argument(
-    "--selected_matrixes_dir", required=True, help="selected matrixes directory"
+    "--selected_matrixes_dir", default=None, help="selected matrixes directory"
+)
+parser.add_argument(
+    "--matrix_store",
+    default=None,
+    help="matrix store (matrixes/matrix_store.py) to read instead of --selected_matrixes_dir",
 )
 parser.add_argument("--output_dir", required=True, help="output directory")
 parser.add_argument("--repeat", type=int, default=10, help="repeat times")
+parser.add_argument(
+    "--chain_cache_size",
+    type=int,
+    default=None,
+    help="max number of dialogue chains kept in memory (default: no limit)",
+)
+parser.add_argument(
+    "--chain_cache_path",
+    default=None,
+    help="SQLite file to persist the dialogue chains across runs (single process only)",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="number of worker processes (the output does not depend on it)",
+)
+parser.add_argument(
+    "--seed", type=int, default=42, help="base seed of the per-task random states"
+)
+parser.add_argument(
+    "--batch",
+    action="store_true",
+    help="generate_dataset: map all repeats of a matrix at once with MatrixMapping.map_batch "
+    "(one seed per matrix, so the sampled feature pairs differ from the per-repeat seeds)",
+)
+parser.add_argument(
+    "--rsa_depth",
+    type=int,
+    default=None,
+    help="speak with the recursive RSA speaker of this depth (recursive_rsa.py, needs numpy); "
+    "default: the frequency-weighted speaker",
+)
+parser.add_argument(
+    "--rsa_alpha",
+    type=float,
+    default=1.0,
+    help="rationality of the recursive RSA speaker (with --rsa_depth)",
+)
+parser.add_argument(
+    "--output_format",
+    choices=["json", "jsonl"],
+    default="json",
+    help="json writes one array at the end, jsonl streams the chains as they are generated",
+)
+parser.add_argument(
+    "--compression",
+    choices=["gzip", "zstd"],
+    default=None,
+    help="compress the --output_format jsonl output (zstd needs the zstandard package)",
+)
 
 
-args = parser.parse_args()
+# set by setup() in the main process only: the workers get everything they need
+# through the pool's initargs, so they also work with the "spawn" start method
+args = None
+strategy = None
+matrix_store = None
+store_views = None
+matrix_files = None
 
-# reload feature_pairs
-with open(args.feature_pairs_file, "r") as file:
-    feature_pairs = [line.strip() for line in file.readlines()]
 
-# set global feature_pairs for mapping.py
-import mapping
+def setup(argv=None):
+    """parse the arguments, load the feature pairs bank, set up the chain cache and list the matrix files"""
+    global args, strategy, matrix_store, store_views, matrix_files
 
-mapping.feature_pairs = feature_pairs
+    args = parser.parse_args(argv)
+    if args.chain_cache_path and args.workers > 1:
+        # each worker keeps its own in-memory chain cache, only a single process reads and writes the file
+        parser.error("--chain_cache_path can only be used with --workers 1")
 
-# read matrix files from the directory
-import glob
+    # load the feature pairs bank (split and conflict graph built once)
+    mapping.load_feature_pairs(args.feature_pairs_file)
+
+    # speaker strategy of the chains (None: the frequency-weighted speaker)
+    strategy = None
+    if args.rsa_depth is not None:
+        from recursive_rsa import RecursiveRSA
+
+        strategy = RecursiveRSA(args.rsa_depth, args.rsa_alpha)
 
-matrix_files = glob.glob(os.path.join(args.selected_matrixes_dir, "*.json"))
-if not matrix_files:
-    raise ValueError(
-        f"no JSON files found in the directory {args.selected_matrixes_dir}"
+    mapping.chain_cache = mapping.ChainCache(
+        maxsize=args.chain_cache_size, path=args.chain_cache_path, strategy=strategy
     )
 
-print(f"found {len(matrix_files)} matrix files")
+    # read matrix files from the directory, or the (shape, rounds) groups of the store
+    matrix_store = None
+    if args.matrix_store:
+        matrix_store = MatrixStore(args.matrix_store)
+        store_views = [
+            matrix_store.records(shape, rounds) for shape, rounds in sorted(matrix_store.counts())
+        ]
+        matrix_files = [view.name for view in store_views]
+        if not matrix_files:
+            raise ValueError(f"no matrices in the store {args.matrix_store}")
+    elif args.selected_matrixes_dir:
+        matrix_files = glob.glob(os.path.join(args.selected_matrixes_dir, "*.json"))
+        if not matrix_files:
+            raise ValueError(
+                f"no JSON files found in the directory {args.selected_matrixes_dir}"
+            )
+    else:
+        raise ValueError("--selected_matrixes_dir or --matrix_store is required")
+
+    matrix_files.sort()
+    print(f"found {len(matrix_files)} matrix files")
+
+
+def load_matrix_files(matrix_files):
+    """
+    read every matrix file once: {file: list of matrix objects};
+    with --matrix_store: {group name: view of the group}, records are read on access
+    """
+    if matrix_store is not None:
+        return {view.name: view for view in store_views}
+
+    matrixes_by_file = {}
+    for matrix_file in matrix_files:
+        with open(matrix_file, "r") as file:
+            matrixes_data = json.load(file)
+        # confirm the data format: JSON array, each element is a matrix object
+        if not isinstance(matrixes_data, list):
+            raise ValueError(
+                f"expected JSON array format, but got {type(matrixes_data)}"
+            )
+        matrixes_by_file[matrix_file] = matrixes_data
+    return matrixes_by_file
+
+
+def task_seed(*keys):
+    """
+    seed of one task, derived from the base seed and e.g. (matrix id, repeat index);
+    hashlib instead of hash() so that it is the same in every process and run
+    """
+    key = ":".join(str(k) for k in (args.seed,) + keys)
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big")
 
 
-def generate_dialogue_chain(matrix_files):
-    # randomly select a matrix file
-    selected_file = random.choice(matrix_files)
+def matrix_id(matrix_file, position):
+    """matrix names repeat across files, so a matrix is identified by file and position"""
+    return f"{os.path.basename(matrix_file)}#{position}"
 
-    # read the matrix file
-    with open(selected_file, "r") as file:
-        matrixes_data = json.load(file)
 
-    # confirm the data format: JSON array, each element is a matrix object
-    if not isinstance(matrixes_data, list):
-        raise ValueError(f"expected JSON array format, but got {type(matrixes_data)}")
+def _init_worker(bank, chain_cache_size, strategy):
+    # the bank is the parent's (pickled once per worker, not reloaded from the file);
+    # each worker keeps its own in-memory chain cache (--chain_cache_path needs --workers 1)
+    mapping.use_feature_bank(bank)
+    mapping.chain_cache = mapping.ChainCache(maxsize=chain_cache_size, strategy=strategy)
 
-    # randomly select a matrix object
-    selected_matrix_obj = random.choice(matrixes_data)
+
+def packed_matrix(matrix_data):
+    """
+    (packed matrix, shape) of a matrix; the tasks carry the matrix packed (one int
+    instead of nested lists to pickle for the workers)
+    """
+    return MatrixMapping(matrix_data).packed()
+
+
+def _dialogue_task(task):
+    code, shape, seed = task
+    return MatrixMapping.from_packed(code, shape).mapping_to_dialogue(rng=random.Random(seed))
+
+
+def _dialogue_batch_task(task):
+    code, shape, seed, count = task
+    return MatrixMapping.from_packed(code, shape).map_batch_to_dialogues(
+        count, rng=random.Random(seed)
+    )
+
+
+def run_dialogue_tasks(tasks, desc, task_function=_dialogue_task):
+    """result of every task, yielded in task order whatever the worker count"""
+    if args.workers <= 1:
+        for task in tqdm(tasks, desc=desc):
+            yield task_function(task)
+        return
+
+    # consecutive tasks often share a matrix, so hand them out in chunks to
+    # keep the workers' chain caches warm
+    chunksize = max(1, min(64, len(tasks) // (args.workers * 4)))
+    with multiprocessing.Pool(
+        args.workers,
+        initializer=_init_worker,
+        initargs=(mapping.feature_bank(), args.chain_cache_size, strategy),
+    ) as pool:
+        yield from tqdm(
+            pool.imap(task_function, tasks, chunksize=chunksize),
+            total=len(tasks),
+            desc=desc,
+        )
+
+
+def generate_dialogue_chain(matrixes_by_file, repeat_index):
+    rng = random.Random(task_seed("repeat", repeat_index))
+    # randomly select a matrix file and a matrix object in it
+    selected_file = rng.choice(sorted(matrixes_by_file))
+    position = rng.randrange(len(matrixes_by_file[selected_file]))
 
     # extract the matrix data
-    matrix_data = selected_matrix_obj["matrix"]
+    matrix_data = matrixes_by_file[selected_file][position]["matrix"]
+
+    # the dialogue chain is generated by mapping.py with the task's seed
+    code, shape = packed_matrix(matrix_data)
+    return code, shape, task_seed(matrix_id(selected_file, position), repeat_index)
 
-    # call the function in mapping.py to generate dialogue chain
-    dialogue_data = MatrixMapping(matrix_data).mapping_to_dialogue()
-    return dialogue_data
+
+def output_file_path(name):
+    """e.g. eval_dialog_chains.jsonl.gz for --output_format jsonl --compression gzip"""
+    if args.output_format == "json":
+        return os.path.join(args.output_dir, f"{name}.json")
+    return with_codec_suffix(os.path.join(args.output_dir, f"{name}.jsonl"), args.compression)
 
 
 def save_dialogue_chains(all_dialogue_data, output_path):
-    # save all dialogue chains to a file
-    with open(output_path, "w") as file:
-        json.dump(all_dialogue_data, file, indent=2, ensure_ascii=False)
+    """save the dialogue chains (any iterable) to a file, returns the number saved"""
+    if output_path.endswith(".json"):
+        all_dialogue_data = list(all_dialogue_data)
+        with open(output_path, "w") as file:
+            json.dump(all_dialogue_data, file, indent=2, ensure_ascii=False)
+        return len(all_dialogue_data)
+
+    # each chain is written as soon as it is generated
+    with JSONLWriter(output_path) as writer:
+        return writer.write_all(all_dialogue_data)
 
 
 def main():
     # create output directory
     os.makedirs(args.output_dir, exist_ok=True)
 
-    # collect all dialogue chains
-    all_dialogue_chains = []
+    # each matrix file is read once for all repeats
+    matrixes_by_file = load_matrix_files(matrix_files)
 
     # repeat generate dialogue chains
-    for i in range(args.repeat):
-        print(f"\n=== generate {i+1}th dialogue chain ===")
-
-        # generate dialogue chain
-        dialogue_data = generate_dialogue_chain(matrix_files)
-
-        # add to the list
-        all_dialogue_chains.append(dialogue_data)
-
-        print(f"generated {i+1}th dialogue chain")
+    tasks = [generate_dialogue_chain(matrixes_by_file, i) for i in range(args.repeat)]
+    all_dialogue_chains = run_dialogue_tasks(tasks, "Generating dialogue chains")
 
     # save all dialogue chains to a file
-    output_path = os.path.join(args.output_dir, "dialogue_chains.json")
-    save_dialogue_chains(all_dialogue_chains, output_path)
+    output_path = output_file_path("dialogue_chains")
+    try:
+        count = save_dialogue_chains(all_dialogue_chains, output_path)
+    finally:
+        mapping.chain_cache.close()
 
-    print(
-        f"\ncompleted! generated {args.repeat} dialogue chains, saved to dialogue_chains.json"
-    )
+    print(f"\ncompleted! generated {count} dialogue chains, saved to {output_path}")
 
 
 def generate_dataset():
     os.makedirs(args.output_dir, exist_ok=True)
-    all_dialogue_chains = []
+    tasks = []
 
-    for file in tqdm(matrix_files, total=len(matrix_files), desc="Generating dataset"):
-        with open(file, "r") as file:
-            matrixes_data = json.load(file)
+    for file, matrixes_data in load_matrix_files(matrix_files).items():
+        positions = list(range(len(matrixes_data)))
         if "1round" in str(file):
             count = 1
             # matrixes_data = matrixes_data[:400] + matrixes_data[600:1200] + matrixes_data[1400:1800]
             # matrixes_data = matrixes_data[400:500] + matrixes_data[1200:1300] + matrixes_data[1700:1800]
             # matrixes_data = matrixes_data[500:600] + matrixes_data[1300:1400] + matrixes_data[1800:1900]
             
-            matrixes_data = matrixes_data[1800:1900]
+            positions = positions[1800:1900]
             
         elif "2round" in str(file):
             count = 5
@@ -120,27 +296,52 @@ def generate_dataset():
             # matrixes_data = matrixes_data[600:1000] + matrixes_data[2200:2600] + matrixes_data[3200:3600]
             # matrixes_data = matrixes_data[1000:1400] + matrixes_data[2600:3000] + matrixes_data[3400:3800]
             
-            matrixes_data = matrixes_data[3600:3800]
+            positions = positions[3600:3800]
 
         else:
             assert "3round" in str(file), f"unknown round number in {file}"
             count = 128
             # matrixes_data = matrixes_data[:20]
             # matrixes_data = matrixes_data[6:26]
-            matrixes_data = random.sample(matrixes_data, 20)
-        
-        for matrix in matrixes_data:
-            data = matrix["matrix"]
-            for _ in range(count):
-                dialogue_data = MatrixMapping(data).mapping_to_dialogue()
-                all_dialogue_chains.append(dialogue_data)
-
-    # output_path = os.path.join(args.output_dir, "imitation_dialog_chains.json")
-    # output_path = os.path.join(args.output_dir, "reasoning_dialog_chains.json")
-    output_path = os.path.join(args.output_dir, "eval_dialog_chains.json")
-    
-    save_dialogue_chains(all_dialogue_chains, output_path)
+            positions = sorted(
+                random.Random(task_seed("sample", os.path.basename(file))).sample(
+                    positions, 20
+                )
+            )
+
+        for position in positions:
+            code, shape = packed_matrix(matrixes_data[position]["matrix"])
+            if args.batch:
+                # all repeats of the matrix in one (matrix, shape, seed, count) task
+                tasks.append((code, shape, task_seed(matrix_id(file, position), "batch"), count))
+                continue
+            for repeat_index in range(count):
+                seed = task_seed(matrix_id(file, position), repeat_index)
+                tasks.append((code, shape, seed))
+
+    if args.batch:
+        all_dialogue_chains = itertools.chain.from_iterable(
+            run_dialogue_tasks(tasks, "Generating dataset", _dialogue_batch_task)
+        )
+    else:
+        all_dialogue_chains = run_dialogue_tasks(tasks, "Generating dataset")
+
+    # output_path = output_file_path("imitation_dialog_chains")
+    # output_path = output_file_path("reasoning_dialog_chains")
+    output_path = output_file_path("eval_dialog_chains")
+
+    try:
+        count = save_dialogue_chains(all_dialogue_chains, output_path)
+    finally:
+        mapping.chain_cache.close()
+    print(f"saved {count} dialogue chains to {output_path}")
+    if args.workers <= 1:
+        print(
+            f"chain cache: {mapping.chain_cache.misses} chains solved, "
+            f"{mapping.chain_cache.hits} reused"
+        )
 
 if __name__ == "__main__":
+    setup()
     # main()
     generate_dataset()
@@ -0,0 +1,205 @@
+"""
+Incremental JSONL output shared by the dialogue and referent set stages.
+
+Records are written one JSON object per line as soon as they are produced,
+instead of collecting a list and writing one indented JSON at the end, so
+memory stays flat and a crash only loses the records after the last sync.
+The output can be gzip (".gz") or zstd (".zst", needs the zstandard package)
+compressed; both are flushed at block boundaries on every sync, so the part
+written so far can always be decoded.
+
+While a writer is open, filename + ".writing" exists. read_jsonl(follow=True)
+uses it to keep reading a file that is still being produced and to stop once
+the producer has closed it.
+"""
+
+import gzip
+import json
+import os
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd output is optional
+    zstandard = None
+
+CODECS = ("gzip", "zstd")
+SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+READ_SIZE = 1 << 16
+
+
+def codec_from_filename(filename):
+    """'gzip', 'zstd' or None (plain text) from the file suffix"""
+    return SUFFIXES.get(os.path.splitext(filename)[1])
+
+
+def with_codec_suffix(filename, codec):
+    """e.g. ('chains.jsonl', 'gzip') -> 'chains.jsonl.gz'"""
+    for suffix, name in SUFFIXES.items():
+        if name == codec:
+            return filename + suffix
+    return filename
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError("zstd compression needs the zstandard package (pip install zstandard)")
+
+
+class JSONLWriter:
+    def __init__(self, filename, codec=None, sync_every=1000, sync_seconds=30.0, append=False):
+        """
+        filename: output file, the codec is taken from its suffix unless given
+        codec: None, 'gzip' or 'zstd'
+        sync_every / sync_seconds: flush and fsync after this many records or seconds
+        append: add to an existing file instead of truncating it
+        """
+        self.filename = filename
+        self.codec = codec if codec is not None else codec_from_filename(filename)
+        if self.codec is not None and self.codec not in CODECS:
+            raise ValueError(f"unknown codec {self.codec}, expected one of {CODECS}")
+        self.sync_every = sync_every
+        self.sync_seconds = sync_seconds
+        self.count = 0
+        self.marker = filename + ".writing"
+
+        with open(self.marker, "w"):
+            pass
+        self.raw = open(filename, "ab" if append else "wb")
+        if self.codec == "gzip":
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode="wb")
+        elif self.codec == "zstd":
+            _require_zstandard()
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, record):
+        self.stream.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.count += 1
+        self._unsynced += 1
+        if (
+            self._unsynced >= self.sync_every
+            or time.time() - self._last_sync >= self.sync_seconds
+        ):
+            self.sync()
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+        return self.count
+
+    def sync(self):
+        """make every record written so far readable and durable"""
+        if self.codec == "zstd":
+            self.stream.flush(zstandard.FLUSH_BLOCK)
+        else:
+            # GzipFile.flush ends the current deflate block (Z_SYNC_FLUSH)
+            self.stream.flush()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def close(self):
+        if self.raw.closed:
+            return
+        try:
+            if self.stream is not self.raw:
+                self.stream.close()  # writes the gzip trailer / ends the zstd frame
+            self.raw.flush()
+            os.fsync(self.raw.fileno())
+        finally:
+            self.raw.close()
+            os.remove(self.marker)
+
+
+def _decompressor(codec):
+    if codec == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if codec == "zstd":
+        _require_zstandard()
+        return zstandard.ZstdDecompressor().decompressobj()
+    return None
+
+
+def _decode_chunks(f, codec, follow, poll_seconds, marker, timeout):
+    """decompressed bytes of f, waiting for more data while the file is being written"""
+    decompressor = _decompressor(codec)
+    idle_since = time.time()
+    closed = not follow
+    while True:
+        chunk = f.read(READ_SIZE)
+        if chunk:
+            idle_since = time.time()
+            if decompressor is None:
+                yield chunk
+                continue
+            # several gzip members / zstd frames when the file was appended to
+            while chunk:
+                yield decompressor.decompress(chunk)
+                if not decompressor.eof:
+                    break
+                chunk = decompressor.unused_data
+                decompressor = _decompressor(codec)
+            continue
+        if closed:
+            return
+        if not os.path.exists(marker):
+            # the writer may have written its last records between the empty read and
+            # the marker check: read once more to the end before stopping
+            closed = True
+            continue
+        if timeout is not None and time.time() - idle_since >= timeout:
+            return
+        time.sleep(poll_seconds)
+
+
+def read_jsonl(filename, codec=None, follow=False, poll_seconds=0.5, timeout=None):
+    """
+    Lazily yield the records of a JSONL file (plain, gzip or zstd).
+
+    follow: keep waiting for new records while the producer still has the file
+            open (see JSONLWriter), so a stage can consume records as they come
+    timeout: with follow, give up after this many seconds without new data
+    A last line without its newline (cut by a crash) is not returned.
+    """
+    codec = codec if codec is not None else codec_from_filename(filename)
+    marker = filename + ".writing"
+    if follow:
+        # the producer may not have created the file yet
+        start = time.time()
+        while not os.path.exists(filename):
+            if timeout is not None and time.time() - start >= timeout:
+                raise FileNotFoundError(filename)
+            time.sleep(poll_seconds)
+
+    with open(filename, "rb") as f:
+        pending = b""
+        for data in _decode_chunks(f, codec, follow, poll_seconds, marker, timeout):
+            pending += data
+            lines = pending.split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_records(filename, follow=False):
+    """
+    Records of a JSON array file or of a JSONL file, so that consumers accept
+    both the old indented JSON outputs and the streamed ones
+    """
+    if filename.endswith(".json"):
+        with open(filename, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return read_jsonl(filename, follow=follow)
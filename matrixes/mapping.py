@@ -6,68 +6,206 @@ import glob
 import argparse
 import sys
 import os
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, MatrixMapping.map_batch falls back to Python
+    np = None
 
 sys.path.append(
     os.path.join(os.path.dirname(__file__), "..", "dialogs", "golden_dialogs")
 )
 from generate_dialogs import GoldenDialogsGenerator
+from chain_cache import ChainCache, words_match_structure
+from feature_bank import FeatureBank
+from bitmatrix import BitMatrixCodec
+from canonical import row_to_mask
+from jsonl_stream import JSONLWriter
+
 
+# global variable, None until the feature pairs are loaded (on first use by default)
+feature_pairs = None
+_bank = None
 
-# global variable
-feature_pairs = []
+# default load feature pairs file
+default_feature_pairs_file = f"{os.environ.get('HOME')}/datasets/rsagame/feature_pairs_bank_01.txt"
 
 
 def load_feature_pairs(file_path):
     """load feature pairs file"""
-    global feature_pairs
-    with open(file_path, "r") as file:
-        feature_pairs = [line.strip() for line in file.readlines()]
+    use_feature_bank(FeatureBank.load(file_path))
 
 
-# default load feature pairs file
-default_feature_pairs_file = f"{os.environ.get('HOME')}/datasets/rsagame/feature_pairs_bank_01.txt"
-load_feature_pairs(default_feature_pairs_file)
+def use_feature_bank(bank):
+    """use an already built FeatureBank, e.g. the parent's in a worker process"""
+    global feature_pairs, _bank
+    feature_pairs = bank.pairs
+    _bank = bank
+
+
+def feature_bank():
+    """
+    the FeatureBank of feature_pairs: the default file is read on first use, and the
+    bank is rebuilt when a script replaces feature_pairs
+    """
+    global _bank
+    if feature_pairs is None:
+        load_feature_pairs(default_feature_pairs_file)
+    if _bank is None or _bank.pairs is not feature_pairs:
+        _bank = FeatureBank(feature_pairs)
+    return _bank
+
+
+def feature_vocabulary():
+    """the interned vocabulary of feature_pairs"""
+    return feature_bank().vocabulary
+
+
+# structural cache of the dialogue chains, shared by all mappings;
+# scripts can replace it with a bounded or persistent ChainCache
+chain_cache = ChainCache()
+
+
+def _sample_assignments(num_pairs, cols, n, generator):
+    """(n, cols) feature pair indices, distinct within each row, uniformly drawn"""
+    if cols * cols > num_pairs:
+        # many collisions expected: take the first cols of a random permutation
+        return generator.random((n, num_pairs)).argsort(axis=1)[:, :cols]
+    assignments = generator.integers(num_pairs, size=(n, cols))
+    while True:
+        ordered = np.sort(assignments, axis=1)
+        repeated = np.flatnonzero((ordered[:, 1:] == ordered[:, :-1]).any(axis=1))
+        if not len(repeated):
+            return assignments
+        assignments[repeated] = generator.integers(num_pairs, size=(len(repeated), cols))
 
 
 class MatrixMapping:
     def __init__(self, matrix):
         self.matrix = matrix
+        self.cols = len(matrix[0])
+        # unexpected values use the first feature by default
+        self.binary_matrix = []
+        for row in matrix:
+            for value in row:
+                if value not in (0, 1):
+                    print(f"Warning: Unexpected value {value} in matrix")
+            self.binary_matrix.append([1 if value == 1 else 0 for value in row])
+        # bit-packed rows: bit (cols - 1 - j) of a row mask is the value of column j
+        self.row_masks = [row_to_mask(row) for row in self.binary_matrix]
+
+    @classmethod
+    def from_packed(cls, code, shape):
+        """create a mapping from a packed matrix (see bitmatrix.py)"""
+        return cls(BitMatrixCodec(shape).decode(code))
 
-    def mapping_to_referent_set(self):
+    def packed(self):
+        """(packed matrix, shape) of the 0/1 matrix, the inverse of from_packed"""
+        shape = (len(self.row_masks), self.cols)
+        return BitMatrixCodec(shape).pack(self.row_masks), shape
+
+    def mapping_to_referent_ids(self, rng=None):
         """
-        map feature pairs to matrix, generate referent set
+        map feature pairs to matrix, generate referent set as feature ids (see feature_vocabulary())
         each column corresponds to a feature pair, the 0/1 in the matrix decides which feature to use
+        rng: random.Random used to sample the feature pairs (default: the global random state)
         """
-        # randomly select feature pairs with the same number of columns as the matrix
-        selected_pairs = random.sample(feature_pairs, len(self.matrix[0]))
+        rng = rng or random
+        bank = feature_bank()
+        vocabulary = bank.vocabulary
+        # randomly select feature pairs with the same number of columns as the matrix,
+        # no two of them sharing a word (see feature_bank.py)
+        selected = bank.sample(self.cols, rng)
+        # ids of each feature pair: index 0 is the first feature, 1 the second
+        pair_features = [vocabulary.pair_ids[i] for i in selected]
         referent_set = []
 
-        for row in self.matrix:  # iterate over each row of the matrix
-            referent = []
-            for col_idx, value in enumerate(row):  # iterate over each column
-                feature_pair = selected_pairs[
-                    col_idx
-                ]  # get the corresponding feature pair
-                features = feature_pair.split(" / ")  # split feature pair
-
-                if value == 0:
-                    referent.append(features[0])  # use the first feature
-                elif value == 1:
-                    referent.append(features[1])  # use the second feature
-                else:
-                    print(f"Warning: Unexpected value {value} in matrix")
-                    referent.append(features[0])  # use the first feature by default
-
-            # directly add the feature list, without converting to a string
+        for mask in self.row_masks:  # iterate over each row of the matrix
+            referent = array(
+                "I",
+                [
+                    features[(mask >> (self.cols - 1 - col_idx)) & 1]
+                    for col_idx, features in enumerate(pair_features)
+                ],
+            )
             referent_set.append(referent)
 
         return referent_set
 
-    def mapping_to_dialogue(self):
-        referent_set = self.mapping_to_referent_set()
-        dialogue_data = GoldenDialogsGenerator(referent_set, 0).generate_dialogue()
+    def mapping_to_referent_set(self, rng=None):
+        """the referent set of mapping_to_referent_ids as lists of feature words"""
+        vocabulary = feature_vocabulary()
+        return [vocabulary.decode(referent) for referent in self.mapping_to_referent_ids(rng)]
+
+    def mapping_to_dialogue(self, rng=None):
+        referent_set = self.mapping_to_referent_ids(rng)
+        # the chain only depends on the matrix, so it is solved once per matrix;
+        # the feature ids are turned into words when the dialogue is rendered
+        dialogue_data = chain_cache.generate_dialogue(
+            self.binary_matrix, referent_set, 0, feature_vocabulary()
+        )
         return dialogue_data
 
+    def mapping_to_all_dialogues(self, rng=None):
+        """the dialogues of one referent set with each row as the target, in row order"""
+        referent_set = self.mapping_to_referent_ids(rng)
+        return chain_cache.generate_all_dialogues(
+            self.binary_matrix, referent_set, feature_vocabulary()
+        )
+
+    def map_batch(self, n, rng=None):
+        """
+        n referent sets of the matrix, each with its own random feature pairs, as feature ids
+        with numpy: one (n, rows, cols) uint32 array, the n pair assignments are drawn at once
+        and the ids are gathered from the bank's two aligned id arrays with fancy indexing;
+        without numpy: a list of n mapping_to_referent_ids() results
+        rng: random.Random (default: the global random state); the draws differ from n calls
+             of mapping_to_referent_ids, and between the numpy and the Python version
+        """
+        rng = rng or random
+        if np is None:
+            return [self.mapping_to_referent_ids(rng) for _ in range(n)]
+
+        bank = feature_bank()
+        vocabulary = bank.vocabulary
+        num_pairs = len(bank)
+        if self.cols > num_pairs:
+            raise ValueError(f"{self.cols} columns but only {num_pairs} feature pairs")
+        if bank.has_conflicts:
+            # some pairs share words: draw each assignment from the conflict graph
+            assignments = np.array([bank.sample(self.cols, rng) for _ in range(n)], dtype=np.intp)
+            assignments = assignments.reshape(n, self.cols)
+        else:
+            generator = np.random.default_rng(rng.getrandbits(64))
+            assignments = _sample_assignments(num_pairs, self.cols, n, generator)
+
+        first_ids = np.frombuffer(vocabulary.first_ids, dtype=np.uint32)[assignments]
+        second_ids = np.frombuffer(vocabulary.second_ids, dtype=np.uint32)[assignments]
+        bits = np.array(self.binary_matrix, dtype=bool)
+        # (n, 1, cols) against (rows, cols): the second feature where the matrix has a 1
+        return np.where(bits, second_ids[:, None, :], first_ids[:, None, :])
+
+    def map_batch_to_dialogues(self, n, rng=None):
+        """
+        dialogues of n referent sets from map_batch; the chain is solved once for the
+        matrix and rendered with each set's words (a set where two columns share a word
+        is solved on its own)
+        """
+        vocabulary = feature_vocabulary()
+        referent_sets = self.map_batch(n, rng)
+        if np is not None:
+            referent_sets = referent_sets.tolist()
+        chain = chain_cache.solve(self.binary_matrix, 0)
+        dialogues = []
+        for referent_set in referent_sets:
+            generator = GoldenDialogsGenerator(referent_set, 0, vocabulary, chain_cache.strategy)
+            if words_match_structure(self.binary_matrix, referent_set):
+                dialogues.append(generator.render_dialogue(chain))
+            else:
+                dialogues.append(generator.generate_dialogue())
+        return dialogues
+
     def save_dialogue(self, dialogue_data, output_dir=None):
         # create a complete data structure with matrix and dialogue information
         complete_data = {
@@ -95,13 +233,15 @@ class MatrixMapping:
         print(f"dialogue saved to {filename}")
 
     @staticmethod
-    def process_all_matrices(json_file_path, output_dir=None):
+    def process_all_matrices(json_file_path, output_dir=None, output_format="json"):
         """
         process all matrices in the JSON file, generate dialogue for each matrix and save
 
         parameters:
         - json_file_path: str, JSON file path
         - output_dir: str, output directory path
+        - output_format: "json" collects the dialogues and writes indented JSON arrays at the end,
+          "jsonl" writes each dialogue to its rounds file as soon as it is generated
         """
         assert output_dir is not None, "output_dir is required"
 
@@ -111,37 +251,6 @@ class MatrixMapping:
 
         print(f"processing {len(matrixes_data)} matrices...")
 
-        # collect data by rounds
-        dialogues_by_rounds = {1: [], 2: [], 3: [], 4: [], "other": []}
-
-        for matrix_name, matrix in matrixes_data.items():
-            print(f"\n=== processing matrix {matrix_name} ===")
-
-            # create MatrixMapping instance
-            mapping = MatrixMapping(matrix)
-
-            # generate dialogue
-            dialogue_data = mapping.mapping_to_dialogue()
-
-            # create complete data structure
-            complete_data = {
-                "matrix_name": matrix_name,
-                "matrix": matrix,
-                "referent_set": dialogue_data["referent_set"],
-                "target_referent": dialogue_data["target_referent"],
-                "dialogue": dialogue_data["dialogue"],
-                "rounds": dialogue_data["rounds"],
-            }
-
-            # collect by rounds
-            rounds = dialogue_data["rounds"]
-            if rounds in [1, 2, 3, 4]:
-                dialogues_by_rounds[rounds].append(complete_data)
-            else:
-                dialogues_by_rounds["other"].append(complete_data)
-
-            print(f"matrix {matrix_name} processed, rounds: {rounds}")
-
         # get the shape of the matrix (from the first matrix)
         if matrixes_data:
             first_matrix = next(iter(matrixes_data.values()))
@@ -151,16 +260,58 @@ class MatrixMapping:
         else:
             matrix_shape = "0x0"
 
+        def rounds_filename(rounds):
+            if rounds == "other":
+                return f"{output_dir}/{matrix_shape}_dialogue_other.{output_format}"
+            return f"{output_dir}/{matrix_shape}_dialogue_{rounds}rounds.{output_format}"
+
+        # collect data by rounds (jsonl: count them, the writers are opened on first use)
+        dialogues_by_rounds = {1: [], 2: [], 3: [], 4: [], "other": []}
+        writers = {}
+
+        try:
+            for matrix_name, matrix in matrixes_data.items():
+                print(f"\n=== processing matrix {matrix_name} ===")
+
+                # create MatrixMapping instance
+                mapping = MatrixMapping(matrix)
+
+                # generate dialogue
+                dialogue_data = mapping.mapping_to_dialogue()
+
+                # create complete data structure
+                complete_data = {
+                    "matrix_name": matrix_name,
+                    "matrix": matrix,
+                    "referent_set": dialogue_data["referent_set"],
+                    "target_referent": dialogue_data["target_referent"],
+                    "dialogue": dialogue_data["dialogue"],
+                    "rounds": dialogue_data["rounds"],
+                }
+
+                # collect by rounds
+                rounds = dialogue_data["rounds"]
+                key = rounds if rounds in [1, 2, 3, 4] else "other"
+                if output_format == "jsonl":
+                    if key not in writers:
+                        writers[key] = JSONLWriter(rounds_filename(key))
+                    writers[key].write(complete_data)
+                else:
+                    dialogues_by_rounds[key].append(complete_data)
+
+                print(f"matrix {matrix_name} processed, rounds: {rounds}")
+        finally:
+            # close the writers even on a crash, so that no .writing marker is left behind
+            # for read_jsonl(follow=True) readers to wait on
+            for writer in writers.values():
+                writer.close()
+
         # save by rounds
+        for rounds, writer in writers.items():
+            print(f"saved {writer.count} {rounds} rounds dialogues to {writer.filename}")
         for rounds, dialogues in dialogues_by_rounds.items():
             if dialogues:  # only save files with data
-                if rounds == "other":
-                    filename = f"{output_dir}/{matrix_shape}_dialogue_other.json"
-                else:
-                    filename = (
-                        f"{output_dir}/{matrix_shape}_dialogue_{rounds}rounds.json"
-                    )
-
+                filename = rounds_filename(rounds)
                 with open(filename, "w") as file:
                     json.dump(dialogues, file, indent=2, ensure_ascii=False)
 
@@ -1,11 +1,31 @@
+import argparse
+import contextlib
+import io
 import itertools
 import json
+import math
+import multiprocessing
+import os
 import time
 
+from bitmatrix import BitMatrixCodec
+from constraints import MatrixConstraints
+from canonical import (
+    balanced_prefixes,
+    iter_canonical_children,
+    iter_canonical_row_sets,
+    mask_to_row,
+    row_to_mask,
+)
+
+# shards per worker, so that uneven shards still balance across the pool
+SHARDS_PER_WORKER = 8
+
 
 class MatrixGenerator:
     def __init__(self, shape):
         self.shape = shape
+        self.codec = BitMatrixCodec(shape)
         self.all_matrices = []
 
     def is_canonical_with_fixed_first_row(self, matrix):
@@ -94,9 +114,10 @@ class MatrixGenerator:
         self.all_matrices = canonical_matrices
         return canonical_matrices
 
-    def generate_canonical_fast_fixed_first_row(self):
+    def generate_canonical_fast_fixed_first_row(self, workers=1):
         """
         Optimized version for fast generation of canonical matrices, with the first row fixed as [1,1,1]
+        With workers > 1 the row combinations are split into shards and checked in a process pool
         """
         rows, cols = self.shape
         print(
@@ -115,6 +136,16 @@ class MatrixGenerator:
 
         print(f"Number of available rows: {len(all_rows)}")
 
+        if workers > 1:
+            canonical_matrices, total_checked = self._generate_fast_sharded(
+                all_rows, workers
+            )
+            print(f"Total combinations checked: {total_checked}")
+            print(f"Number of canonical matrices: {len(canonical_matrices)}")
+
+            self.all_matrices = canonical_matrices
+            return canonical_matrices
+
         # Use a more efficient canonical form check
         canonical_matrices = []
         total_checked = 0
@@ -141,6 +172,57 @@ class MatrixGenerator:
         self.all_matrices = canonical_matrices
         return canonical_matrices
 
+    def _generate_fast_sharded(self, all_rows, workers):
+        """
+        Split itertools.combinations(all_rows, rows - 1) into contiguous shards by
+        combinatorial rank, check the shards in a process pool and concatenate the
+        results in shard order, so the output is the same as the serial run
+        """
+        rows, _ = self.shape
+        total = math.comb(len(all_rows), rows - 1)
+        num_shards = max(1, min(total, workers * SHARDS_PER_WORKER))
+        bounds = [total * i // num_shards for i in range(num_shards + 1)]
+        tasks = [
+            (self.shape, bounds[i], bounds[i + 1])
+            for i in range(num_shards)
+            if bounds[i] < bounds[i + 1]
+        ]
+        print(f"Checking {total} combinations in {len(tasks)} shards with {workers} workers...")
+
+        canonical_matrices = []
+        with multiprocessing.Pool(workers) as pool:
+            # imap keeps the shard order, whatever order the shards finish in
+            for shard_idx, shard_matrices in enumerate(
+                pool.imap(_fast_shard_worker, tasks), 1
+            ):
+                canonical_matrices.extend(shard_matrices)
+                print(
+                    f"Finished shard {shard_idx}/{len(tasks)}, "
+                    f"{len(canonical_matrices)} canonical matrices so far"
+                )
+        return canonical_matrices, total
+
+    def canonical_fast_in_rank_range(self, start, stop):
+        """
+        Canonical matrices among the row combinations whose rank (position in
+        itertools.combinations order) is in [start, stop)
+        """
+        rows, cols = self.shape
+        first_row = tuple([1] * cols)
+        all_rows = [
+            tuple(combo)
+            for combo in itertools.product([0, 1], repeat=cols)
+            if tuple(combo) != first_row
+        ]
+
+        canonical_matrices = []
+        for indices in _iter_combinations_from(len(all_rows), rows - 1, start, stop - start):
+            # combinations of the sorted rows are already sorted
+            matrix_sorted = [first_row] + [all_rows[i] for i in indices]
+            if self.is_canonical_fast_fixed_first_row(matrix_sorted):
+                canonical_matrices.append(matrix_sorted)
+        return canonical_matrices
+
     def is_canonical_fast_fixed_first_row(self, matrix):
         """
         Fast check for canonical form (optimized version), strictly following the original algorithm logic
@@ -157,28 +239,320 @@ class MatrixGenerator:
             if matrix[i] < matrix[i - 1]:
                 return False
 
-        # According to the original algorithm: permute all columns, then sort rows
-        cols_list = list(zip(*matrix))
+        # According to the original algorithm: permute all columns, then sort rows.
+        # Rows are compared as bitmasks, and each permutation is a lookup table
+        codec = self.codec if self.codec.cols == cols else BitMatrixCodec((rows, cols))
+        masks = codec.encode_rows(matrix)
+        masks_sorted = codec.sort_rows(masks, keep_first=False)
 
         # Check if there is a smaller column arrangement
         for perm in itertools.permutations(range(cols)):
             if perm == tuple(range(cols)):  # Skip the original arrangement
                 continue
 
-            perm_cols = [cols_list[i] for i in perm]
-            perm_matrix = list(zip(*perm_cols))
             # Key: sort all rows, including the first row!
-            perm_matrix_sorted = tuple(sorted(perm_matrix))
+            perm_masks_sorted = codec.sort_rows(
+                codec.permute_columns(masks, perm), keep_first=False
+            )
 
-            if perm_matrix_sorted < tuple(sorted(matrix)):
+            if perm_masks_sorted < masks_sorted:
                 return False
 
         return True
 
+    def generate_canonical_orderly(self, packed=False, workers=1, constraints=None):
+        """
+        Orderly generation of canonical matrices, with the first row fixed as [1,1,1].
+        Instead of testing every row combination against every column permutation,
+        canonical row sets are grown one row at a time and non-canonical branches
+        are pruned, so the work is proportional to the number of canonical matrices.
+        Produces the same matrices, in the same order, as generate_canonical_fast_fixed_first_row.
+        With packed=True every matrix is kept as one packed int (see bitmatrix.py).
+        With workers > 1 the search tree is split by canonical prefixes and the
+        subtrees are generated in a process pool, then merged in prefix order.
+        With constraints (a constraints.MatrixConstraints), branches that cannot
+        produce a wanted matrix are pruned and only the wanted matrices are kept.
+        """
+        rows, cols = self.shape
+        print(
+            f"Orderly generation of canonical {rows}x{cols} matrices (first row fixed as [1,1,1])..."
+        )
+
+        first_row = tuple([1] * cols)
+
+        if workers > 1:
+            row_sets = self._iter_orderly_sharded(workers, constraints=constraints)
+        else:
+            row_sets = _iter_constrained_row_sets(cols, rows - 1, constraints=constraints)
+
+        canonical_matrices = self.codec.new_array() if packed else []
+        for row_set in row_sets:
+            if packed:
+                canonical_matrices.append(
+                    self.codec.pack((self.codec.full_row,) + row_set)
+                )
+            else:
+                matrix = [first_row] + [mask_to_row(mask, cols) for mask in row_set]
+                canonical_matrices.append(matrix)
+            if len(canonical_matrices) % 10000 == 0:
+                print(f"Found {len(canonical_matrices)} canonical matrices...")
+
+        print(f"Number of canonical matrices: {len(canonical_matrices)}")
+
+        self.all_matrices = canonical_matrices
+        return canonical_matrices
+
+    def generate_canonical_augmented(self, parent_file, packed=False, workers=1):
+        """
+        Canonical matrices of this shape grown by one row from the canonical
+        (rows - 1) x cols matrices of parent_file (a matrixes_RxC .json or .jsonl
+        file). Every canonical matrix is its parent plus one row larger than the
+        parent's rows, so nothing is duplicated and only the last row is searched.
+        Produces the same matrices, in the same order, as generate_canonical_orderly.
+        """
+        rows, cols = self.shape
+        parents = self.load_parent_row_sets(parent_file, (rows - 1, cols))
+        print(
+            f"Augmenting {len(parents)} canonical {rows - 1}x{cols} matrices to {rows}x{cols}..."
+        )
+        return self._collect_row_sets(self.augment_row_sets(parents, workers), packed)
+
+    def augment_row_sets(self, parents, workers=1):
+        """Canonical row sets of this shape from the canonical row sets one row shorter, in order"""
+        cols = self.shape[1]
+        if workers <= 1:
+            children = []
+            for parent in parents:
+                children.extend(iter_canonical_children(parent, cols))
+            return children
+
+        chunk_size = max(1, math.ceil(len(parents) / (workers * SHARDS_PER_WORKER)))
+        tasks = [
+            (cols, parents[start : start + chunk_size])
+            for start in range(0, len(parents), chunk_size)
+        ]
+        children = []
+        with multiprocessing.Pool(workers) as pool:
+            for chunk_children in pool.imap(_augment_worker, tasks):
+                children.extend(chunk_children)
+        return children
+
+    @staticmethod
+    def load_parent_row_sets(filename, shape):
+        """Row masks (without the all-ones first row) of the matrices of a matrixes_RxC file"""
+        with open(filename, "r", encoding="utf-8") as f:
+            if filename.endswith(".jsonl"):
+                matrices = [json.loads(line)["matrix"] for line in f]
+            else:
+                matrices = list(json.load(f).values())
+
+        row_sets = []
+        for matrix in matrices:
+            if (len(matrix), len(matrix[0])) != tuple(shape):
+                raise ValueError(
+                    f"{filename} has {len(matrix)}x{len(matrix[0])} matrices, "
+                    f"expected {shape[0]}x{shape[1]}"
+                )
+            row_sets.append(tuple(row_to_mask(row) for row in matrix[1:]))
+        return row_sets
+
+    def _collect_row_sets(self, row_sets, packed=False):
+        """Turn canonical row sets into matrices (or packed ints) and keep them in all_matrices"""
+        cols = self.shape[1]
+        first_row = tuple([1] * cols)
+        canonical_matrices = self.codec.new_array() if packed else []
+        for row_set in row_sets:
+            if packed:
+                canonical_matrices.append(self.codec.pack((self.codec.full_row,) + row_set))
+            else:
+                canonical_matrices.append(
+                    [first_row] + [mask_to_row(mask, cols) for mask in row_set]
+                )
+
+        print(f"Number of canonical matrices: {len(canonical_matrices)}")
+        self.all_matrices = canonical_matrices
+        return canonical_matrices
+
+    def _iter_orderly_sharded(self, workers, constraints=None):
+        """Canonical row sets generated from canonical prefixes in a process pool, in order"""
+        for row_sets in self._iter_orderly_shards(workers, constraints=constraints):
+            yield from row_sets
+
+    def _iter_orderly_shards(self, workers, after=None, constraints=None):
+        """
+        Lists of canonical row sets, one per subtree in prefix order, generated
+        in a process pool; with after, only the sets following it are generated
+        """
+        rows, cols = self.shape
+        size = rows - 1
+        if size < 2:
+            yield list(_iter_constrained_row_sets(cols, size, after=after, constraints=constraints))
+            return
+
+        # prefixes of varying length, so that no subtree holds more than a small
+        # share of the sets (fixed two-row prefixes left 30% of 8x5 in one subtree)
+        tasks = [
+            (self.shape, prefix, after, constraints)
+            for prefix in balanced_prefixes(cols, size, SHARDS_PER_WORKER * workers)
+            if after is None or prefix >= tuple(after[: len(prefix)])
+        ]
+        print(f"Generating {len(tasks)} subtrees with {workers} workers...")
+        with multiprocessing.Pool(workers) as pool:
+            yield from pool.imap(_orderly_shard_worker, tasks)
+
+    def generate_to_stream(
+        self, filename, method="orderly", workers=1, checkpoint_seconds=60
+    ):
+        """
+        Stream canonical matrices to a JSONL file as they are found, one
+        {"matrix_name": "matrixN", "matrix": [...]} object per line, instead of
+        keeping them in self.all_matrices.
+
+        The progress (the next combination rank for the fast method, the last
+        emitted row set for the orderly one) is checkpointed to filename + ".ckpt"
+        every checkpoint_seconds, together with the size of the flushed output.
+        If a checkpoint exists, the output is truncated back to that size and the
+        enumeration resumes from there, so no matrix is written twice.
+        """
+        rows, cols = self.shape
+        checkpoint_file = filename + ".ckpt"
+        state = {"shape": list(self.shape), "method": method, "emitted": 0, "offset": 0}
+        if os.path.exists(checkpoint_file):
+            with open(checkpoint_file, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved["shape"] != state["shape"] or saved["method"] != method:
+                raise ValueError(
+                    f"checkpoint {checkpoint_file} is for a {saved['shape']} {saved['method']} run"
+                )
+            state = saved
+            if state.get("done"):
+                print(f"{filename} is already complete ({state['emitted']} matrices)")
+                return state["emitted"]
+            print(f"Resuming from checkpoint: {state['emitted']} matrices already saved")
+
+        first_row = tuple([1] * cols)
+        mode = "r+b" if os.path.exists(filename) else "wb"
+        with open(filename, mode) as output:
+            # drop anything written after the last checkpoint
+            output.seek(state["offset"])
+            output.truncate()
+
+            def save_checkpoint(done=False):
+                output.flush()
+                os.fsync(output.fileno())
+                state["offset"] = output.tell()
+                state["done"] = done
+                tmp_file = checkpoint_file + ".tmp"
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(tmp_file, checkpoint_file)
+
+            def write_matrix(matrix):
+                state["emitted"] += 1
+                line = json.dumps(
+                    {"matrix_name": f"matrix{state['emitted']}", "matrix": matrix},
+                    ensure_ascii=False,
+                )
+                output.write(line.encode("utf-8") + b"\n")
+
+            last_checkpoint = time.time()
+            if method == "fast":
+                all_rows = [
+                    tuple(combo)
+                    for combo in itertools.product([0, 1], repeat=cols)
+                    if tuple(combo) != first_row
+                ]
+                total = math.comb(len(all_rows), rows - 1)
+                rank = state.setdefault("rank", 0)
+                if workers > 1:
+                    num_shards = max(1, min(total - rank, workers * SHARDS_PER_WORKER))
+                    bounds = [
+                        rank + (total - rank) * i // num_shards
+                        for i in range(num_shards + 1)
+                    ]
+                    tasks = [
+                        (self.shape, bounds[i], bounds[i + 1])
+                        for i in range(num_shards)
+                        if bounds[i] < bounds[i + 1]
+                    ]
+                    with multiprocessing.Pool(workers) as pool:
+                        for task, shard_matrices in zip(
+                            tasks, pool.imap(_fast_shard_worker, tasks)
+                        ):
+                            for matrix in shard_matrices:
+                                write_matrix(matrix)
+                            state["rank"] = task[2]
+                            save_checkpoint()
+                            print(f"Checked {task[2]}/{total} combinations...")
+                else:
+                    for indices in _iter_combinations_from(
+                        len(all_rows), rows - 1, rank, total - rank
+                    ):
+                        matrix_sorted = [first_row] + [all_rows[i] for i in indices]
+                        if self.is_canonical_fast_fixed_first_row(matrix_sorted):
+                            write_matrix(matrix_sorted)
+                        state["rank"] += 1
+                        if time.time() - last_checkpoint >= checkpoint_seconds:
+                            save_checkpoint()
+                            last_checkpoint = time.time()
+                            print(f"Checked {state['rank']}/{total} combinations...")
+            else:
+                after = state.get("after")
+                if workers > 1:
+                    shards = self._iter_orderly_shards(workers, after=after)
+                else:
+                    shards = (
+                        [row_set]
+                        for row_set in iter_canonical_row_sets(cols, rows - 1, after=after)
+                    )
+                for row_sets in shards:
+                    for row_set in row_sets:
+                        write_matrix(
+                            [first_row] + [mask_to_row(mask, cols) for mask in row_set]
+                        )
+                        state["after"] = list(row_set)
+                    if workers > 1 or time.time() - last_checkpoint >= checkpoint_seconds:
+                        save_checkpoint()
+                        last_checkpoint = time.time()
+                        print(f"Saved {state['emitted']} canonical matrices...")
+
+            save_checkpoint(done=True)
+
+        print(f"Number of canonical matrices: {state['emitted']}")
+        print(f"Matrices streamed to: {filename}")
+        return state["emitted"]
+
+    @staticmethod
+    def stream_to_json(jsonl_filename, filename):
+        """
+        Convert a streamed JSONL file to the {"matrixN": matrix} JSON file written by
+        save_matrices_to_json (byte for byte), one matrix at a time
+        """
+        with open(jsonl_filename, "r", encoding="utf-8") as source, open(
+            filename, "w", encoding="utf-8"
+        ) as f:
+            f.write("{")
+            count = 0
+            for line in source:
+                record = json.loads(line)
+                f.write("," if count else "")
+                # nest the matrix one level deeper, as json.dump(indent=2) does
+                matrix_json = json.dumps(record["matrix"], indent=2, ensure_ascii=False)
+                f.write(
+                    f'\n  {json.dumps(record["matrix_name"])}: '
+                    + matrix_json.replace("\n", "\n  ")
+                )
+                count += 1
+            f.write("\n}" if count else "}")
+        print(f"Matrices saved to: {filename}")
+        return count
+
     def save_matrices_to_json(self, filename):
         """Save matrices to a JSON file"""
         matrices_dict = {}
         for i, matrix in enumerate(self.all_matrices, 1):
+            if isinstance(matrix, int):  # packed matrix
+                matrix = self.codec.decode(matrix)
             matrices_dict[f"matrix{i}"] = matrix
 
         with open(filename, "w", encoding="utf-8") as f:
@@ -188,22 +562,271 @@ class MatrixGenerator:
         print(f"Total number of canonical matrices generated: {len(self.all_matrices)}")
 
 
-if __name__ == "__main__":
-    # Test 5x3 matrix
-    test_shapes = (8, 5)
-    print(f"Start generating canonical {test_shapes[0]}x{test_shapes[1]} matrices...")
+def _unrank_combination(rank, n, k):
+    """The k-combination of range(n) at position rank in itertools.combinations order"""
+    combination = []
+    value = 0
+    for slot in range(k):
+        while True:
+            # number of combinations whose element at this slot is value
+            count = math.comb(n - value - 1, k - slot - 1)
+            if rank < count:
+                break
+            rank -= count
+            value += 1
+        combination.append(value)
+        value += 1
+    return combination
+
+
+def _iter_combinations_from(n, k, start, count):
+    """Yield count k-combinations of range(n), starting at rank start, in lexicographic order"""
+    if count <= 0:
+        return
+    indices = _unrank_combination(start, n, k)
+    yield tuple(indices)
+    for _ in range(count - 1):
+        # same successor step as itertools.combinations
+        for i in reversed(range(k)):
+            if indices[i] != i + n - k:
+                break
+        else:
+            return
+        indices[i] += 1
+        for j in range(i + 1, k):
+            indices[j] = indices[j - 1] + 1
+        yield tuple(indices)
+
+
+def _fast_shard_worker(task):
+    shape, start, stop = task
+    return MatrixGenerator(shape).canonical_fast_in_rank_range(start, stop)
+
+
+def _iter_constrained_row_sets(cols, size, prefix=(), after=None, constraints=None):
+    """iter_canonical_row_sets, pruned and filtered by the constraints if any"""
+    if not constraints:
+        return iter_canonical_row_sets(cols, size, prefix, after)
+    row_sets = iter_canonical_row_sets(
+        cols, size, prefix, after, prune=lambda row_set: constraints.prune(row_set, cols)
+    )
+    return (row_set for row_set in row_sets if constraints.accept(row_set, cols))
 
-    start_time = time.time()
-    generator = MatrixGenerator(test_shapes)
 
-    # Use the fast version, with the first row fixed
-    matrices = generator.generate_canonical_fast_fixed_first_row()
+def _orderly_shard_worker(task):
+    shape, prefix, after, constraints = task
+    rows, cols = shape
+    if constraints and constraints.prune(prefix, cols):
+        return []
+    return list(_iter_constrained_row_sets(cols, rows - 1, prefix, after, constraints))
+
 
-    elapsed = time.time() - start_time
-    print(f"Total time: {elapsed:.2f} seconds")
+def _augment_worker(task):
+    cols, parents = task
+    children = []
+    for parent in parents:
+        children.extend(iter_canonical_children(parent, cols))
+    return children
 
-    # Save the results
-    basepath = "$HOME/datasets/rsagame/01_matrixes/matrixes_unsorted"
+
+def sweep_rows(start_shape, max_rows, output_dir, workers=1):
+    """
+    Generate start_shape with the orderly method, then every shape up to
+    max_rows x cols by augmenting the previous one, saving each shape to
+    output_dir/matrixes_RxC.json
+    """
+    start_rows, cols = start_shape
+    generator = MatrixGenerator(start_shape)
+    start_time = time.time()
+    generator.generate_canonical_orderly(workers=workers)
+    row_sets = [tuple(row_to_mask(row) for row in m[1:]) for m in generator.all_matrices]
     generator.save_matrices_to_json(
-        basepath + f"/matrixes_{test_shapes[0]}x{test_shapes[1]}.json"
+        os.path.join(output_dir, f"matrixes_{start_rows}x{cols}.json")
     )
+    print(f"{start_rows}x{cols}: {time.time() - start_time:.2f} seconds")
+
+    for rows in range(start_rows + 1, max_rows + 1):
+        start_time = time.time()
+        generator = MatrixGenerator((rows, cols))
+        row_sets = generator.augment_row_sets(row_sets, workers)
+        generator._collect_row_sets(row_sets)
+        generator.save_matrices_to_json(os.path.join(output_dir, f"matrixes_{rows}x{cols}.json"))
+        print(f"{rows}x{cols}: {time.time() - start_time:.2f} seconds")
+
+
+def compare_with_fast_fixed_first_row(max_shape=(8, 5)):
+    """
+    Time the orderly generator against generate_canonical_fast_fixed_first_row
+    for every shape up to max_shape, and check that both give the same matrices
+    """
+    max_rows, max_cols = max_shape
+    results = []
+    print(f"{'shape':>6} {'matrices':>9} {'fast (s)':>10} {'orderly (s)':>12} {'speedup':>8}  same")
+    for cols in range(1, max_cols + 1):
+        for rows in range(2, max_rows + 1):
+            if rows - 1 > 2**cols - 1:
+                continue
+            timings = {}
+            outputs = {}
+            for method in ("fast", "orderly"):
+                generator = MatrixGenerator((rows, cols))
+                start_time = time.time()
+                # silence the progress prints of the generators
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if method == "fast":
+                        outputs[method] = generator.generate_canonical_fast_fixed_first_row()
+                    else:
+                        outputs[method] = generator.generate_canonical_orderly()
+                timings[method] = time.time() - start_time
+
+            same = outputs["fast"] == outputs["orderly"]
+            speedup = timings["fast"] / max(timings["orderly"], 1e-9)
+            results.append(
+                {
+                    "shape": (rows, cols),
+                    "matrices": len(outputs["fast"]),
+                    "fast_seconds": timings["fast"],
+                    "orderly_seconds": timings["orderly"],
+                    "same": same,
+                }
+            )
+            print(
+                f"{rows}x{cols:<4} {len(outputs['fast']):>9} {timings['fast']:>10.3f} "
+                f"{timings['orderly']:>12.3f} {speedup:>7.1f}x  {same}"
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate canonical referent matrices")
+    parser.add_argument("--rows", type=int, default=8, help="Number of rows")
+    parser.add_argument("--cols", type=int, default=5, help="Number of columns")
+    parser.add_argument(
+        "--method",
+        choices=["orderly", "fast"],
+        default="orderly",
+        help="orderly: canonical augmentation, fast: permutation check of every row combination",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=f"{os.environ.get('HOME')}/datasets/rsagame/01_matrixes/matrixes_unsorted",
+        help="Output directory",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes (the output is the same for any value)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream matrices to a JSONL file with checkpoints (resumes automatically), then convert it to JSON",
+    )
+    parser.add_argument(
+        "--checkpoint_seconds",
+        type=float,
+        default=60,
+        help="Seconds between checkpoints in --stream mode",
+    )
+    parser.add_argument(
+        "--augment_from",
+        type=str,
+        default=None,
+        help="Build rows x cols by adding one row to the matrices of this (rows-1) x cols file",
+    )
+    parser.add_argument(
+        "--sweep_from",
+        type=int,
+        default=None,
+        help="Generate every shape from sweep_from x cols up to rows x cols, each from the previous one",
+    )
+    parser.add_argument(
+        "--chain_rounds",
+        type=int,
+        default=None,
+        help="Only keep the matrices whose rational chain has this many rounds (orderly method)",
+    )
+    parser.add_argument(
+        "--unique_target",
+        action="store_true",
+        help="Only keep the matrices whose chain ends with the target as the only candidate",
+    )
+    parser.add_argument(
+        "--no_dominated_columns",
+        action="store_true",
+        help="Drop the matrices where a column's ones are a subset of another column's",
+    )
+    parser.add_argument(
+        "--target_row",
+        type=int,
+        default=0,
+        help="Target row for --chain_rounds / --unique_target (0 is the all-ones row)",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Compare both methods on every shape up to rows x cols instead of generating",
+    )
+    args = parser.parse_args()
+
+    constraints = MatrixConstraints(
+        rounds=args.chain_rounds,
+        unique_target=args.unique_target,
+        no_dominated_columns=args.no_dominated_columns,
+        target_row=args.target_row,
+    )
+    if constraints and (args.method != "orderly" or args.stream or args.augment_from):
+        parser.error("constraints are only supported by the (non-stream) orderly method")
+
+    if args.compare:
+        compare_with_fast_fixed_first_row((args.rows, args.cols))
+    elif args.sweep_from is not None:
+        sweep_rows((args.sweep_from, args.cols), args.rows, args.output_dir, workers=args.workers)
+    elif args.stream:
+        test_shapes = (args.rows, args.cols)
+        output_path = os.path.join(
+            args.output_dir, f"matrixes_{test_shapes[0]}x{test_shapes[1]}"
+        )
+        start_time = time.time()
+        generator = MatrixGenerator(test_shapes)
+        generator.generate_to_stream(
+            output_path + ".jsonl",
+            method=args.method,
+            workers=args.workers,
+            checkpoint_seconds=args.checkpoint_seconds,
+        )
+        elapsed = time.time() - start_time
+        print(f"Total time: {elapsed:.2f} seconds")
+        MatrixGenerator.stream_to_json(output_path + ".jsonl", output_path + ".json")
+    else:
+        test_shapes = (args.rows, args.cols)
+        print(f"Start generating canonical {test_shapes[0]}x{test_shapes[1]} matrices...")
+
+        start_time = time.time()
+        generator = MatrixGenerator(test_shapes)
+
+        if args.augment_from:
+            matrices = generator.generate_canonical_augmented(
+                args.augment_from, workers=args.workers
+            )
+        elif args.method == "fast":
+            matrices = generator.generate_canonical_fast_fixed_first_row(
+                workers=args.workers
+            )
+        else:
+            matrices = generator.generate_canonical_orderly(
+                workers=args.workers, constraints=constraints
+            )
+
+        elapsed = time.time() - start_time
+        print(f"Total time: {elapsed:.2f} seconds")
+
+        # Save the results
+        suffix = f"_{constraints.describe()}" if constraints else ""
+        generator.save_matrices_to_json(
+            os.path.join(
+                args.output_dir, f"matrixes_{test_shapes[0]}x{test_shapes[1]}{suffix}.json"
+            )
+        )
@@ -0,0 +1,193 @@
+"""
+SQLite store of matrix records, keyed by (shape, rounds, id).
+
+The selected matrix files are JSON arrays of records ({"matrix_name",
+"matrix", ...}); sampling one matrix from them means parsing a whole file.
+The store keeps every record once, with ids numbered 0, 1, ... inside each
+(shape, rounds) group, so a record is a primary-key lookup and a uniform
+sample is a random id. Records of unknown chain length use rounds 0.
+
+    python matrixes/matrix_store.py import --store matrixes.db selected_matrixes_*rounds.json
+    python matrixes/matrix_store.py summary --store matrixes.db
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+
+from jsonl_stream import read_records
+
+
+def shape_of(matrix):
+    """e.g. '8x5'"""
+    return f"{len(matrix)}x{len(matrix[0])}"
+
+
+def rounds_from_filename(filename):
+    """1 for selected_matrixes_1rounds.json or 8x5_dialogue_1rounds.jsonl, 0 if unknown"""
+    match = re.search(r"(\d+)rounds?", os.path.basename(filename))
+    return int(match.group(1)) if match else 0
+
+
+class MatrixStore:
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS matrices ("
+            " shape TEXT NOT NULL, rounds INTEGER NOT NULL, id INTEGER NOT NULL,"
+            " record TEXT NOT NULL, PRIMARY KEY (shape, rounds, id)) WITHOUT ROWID"
+        )
+        self._counts = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def counts(self):
+        """{(shape, rounds): number of records}"""
+        if self._counts is None:
+            self._counts = {
+                (shape, rounds): count
+                for shape, rounds, count in self.db.execute(
+                    "SELECT shape, rounds, COUNT(*) FROM matrices GROUP BY shape, rounds"
+                )
+            }
+        return self._counts
+
+    def count(self, shape=None, rounds=None):
+        return sum(n for key, n in self._groups(shape, rounds))
+
+    def _groups(self, shape=None, rounds=None):
+        return [
+            (key, n)
+            for key, n in sorted(self.counts().items())
+            if (shape is None or key[0] == shape) and (rounds is None or key[1] == rounds)
+        ]
+
+    def add(self, records, rounds=0, shape=None):
+        """Append records (dicts with a "matrix"), returns their (shape, rounds, id) keys"""
+        # the ids are allocated inside the write transaction, so that two processes
+        # adding to the same store do not hand out the same ids
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            next_ids = {}
+            keys = []
+            rows = []
+            for record in records:
+                key_shape = shape or shape_of(record["matrix"])
+                group = (key_shape, rounds)
+                if group not in next_ids:
+                    next_ids[group] = self.db.execute(
+                        "SELECT COALESCE(MAX(id) + 1, 0) FROM matrices WHERE shape = ? AND rounds = ?",
+                        group,
+                    ).fetchone()[0]
+                record_id = next_ids[group]
+                next_ids[group] = record_id + 1
+                keys.append((key_shape, rounds, record_id))
+                rows.append((key_shape, rounds, record_id, json.dumps(record, ensure_ascii=False)))
+            self.db.executemany("INSERT INTO matrices VALUES (?, ?, ?, ?)", rows)
+            self.db.commit()
+        except BaseException:
+            self.db.rollback()
+            raise
+        finally:
+            # counted again on the next counts()
+            self._counts = None
+        return keys
+
+    def import_file(self, filename, rounds=None):
+        """Add the records of a JSON / JSONL matrix file; rounds default to the file name's"""
+        if rounds is None:
+            rounds = rounds_from_filename(filename)
+        records = read_records(filename)
+        if isinstance(records, dict):  # matrixes_RxC.json: {matrix_name: matrix}
+            records = [{"matrix_name": name, "matrix": m} for name, m in records.items()]
+        return len(self.add(records, rounds=rounds))
+
+    def get(self, shape, rounds, record_id):
+        row = self.db.execute(
+            "SELECT record FROM matrices WHERE shape = ? AND rounds = ? AND id = ?",
+            (shape, rounds, record_id),
+        ).fetchone()
+        if row is None:
+            raise KeyError((shape, rounds, record_id))
+        return json.loads(row[0])
+
+    def records(self, shape, rounds):
+        """Sequence view of one (shape, rounds) group"""
+        return StoreView(self, shape, rounds)
+
+    def iter_records(self, shape=None, rounds=None):
+        for (key_shape, key_rounds), _ in self._groups(shape, rounds):
+            for (record,) in self.db.execute(
+                "SELECT record FROM matrices WHERE shape = ? AND rounds = ? ORDER BY id",
+                (key_shape, key_rounds),
+            ):
+                yield json.loads(record)
+
+    def sample(self, rng=random, shape=None, rounds=None, by_group=False):
+        """
+        A uniformly random record among the groups matching shape / rounds;
+        with by_group, a uniformly random group first and then a record in it
+        (like choosing a matrix file and then a matrix)
+        """
+        groups = self._groups(shape, rounds)
+        if by_group:
+            (key_shape, key_rounds), n = rng.choice(groups)
+            return self.get(key_shape, key_rounds, rng.randrange(n))
+        r = rng.randrange(sum(n for _, n in groups))
+        for (key_shape, key_rounds), n in groups:
+            if r < n:
+                return self.get(key_shape, key_rounds, r)
+            r -= n
+
+    def close(self):
+        self.db.close()
+
+
+class StoreView:
+    """len() and [id] access to the records of one (shape, rounds) group"""
+
+    def __init__(self, store, shape, rounds):
+        self.store = store
+        self.shape = shape
+        self.rounds = rounds
+        self.name = f"{shape}_{rounds}rounds"
+
+    def __len__(self):
+        return self.store.counts().get((self.shape, self.rounds), 0)
+
+    def __getitem__(self, record_id):
+        if not 0 <= record_id < len(self):
+            raise IndexError(record_id)
+        return self.store.get(self.shape, self.rounds, record_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or inspect a matrix store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="add matrix files to the store")
+    import_parser.add_argument("--store", required=True, help="SQLite file")
+    import_parser.add_argument("--rounds", type=int, default=None,
+                               help="chain length of the files (default: from the file names)")
+    import_parser.add_argument("files", nargs="+", help="JSON / JSONL matrix files")
+
+    summary_parser = subparsers.add_parser("summary", help="count records per shape and rounds")
+    summary_parser.add_argument("--store", required=True, help="SQLite file")
+
+    args = parser.parse_args()
+
+    with MatrixStore(args.store) as store:
+        if args.command == "import":
+            for filename in args.files:
+                count = store.import_file(filename, rounds=args.rounds)
+                print(f"imported {count} matrices from {filename}")
+        for (shape, rounds), count in sorted(store.counts().items()):
+            print(f"{shape} {rounds} rounds: {count}")
@@ -3,62 +3,104 @@ import json
 import os
 import glob
 from mapping import MatrixMapping, load_feature_pairs
+from jsonl_stream import JSONLWriter, with_codec_suffix
+from canonical_sampler import CanonicalSampler
+from matrix_store import MatrixStore
 import argparse
 
 parser = argparse.ArgumentParser(description='随机选择一个矩阵，并生成对话链条')
 parser.add_argument('--feature_pairs_file', required=True, help='特征对文件路径')
-parser.add_argument('--selected_matrixes_dir', required=True, help='已选择矩阵目录')
+parser.add_argument('--selected_matrixes_dir', default=None, help='已选择矩阵目录')
+parser.add_argument('--sample_shape', default=None,
+                    help='不读取矩阵文件，直接均匀采样该形状（如 16x10）的 canonical 矩阵')
+parser.add_argument('--seed', type=int, default=None, help='随机种子（矩阵的选择、特征对的采样和 --sample_shape 采样器），默认不固定')
+parser.add_argument('--matrix_store', default=None,
+                    help='从矩阵库（matrixes/matrix_store.py）中随机读取矩阵，代替 --selected_matrixes_dir')
 parser.add_argument('--output_dir', required=True, help='输出目录')
 parser.add_argument('--repeat', type=int, default=10, help='重复次数')
+parser.add_argument('--output_format', choices=['json', 'jsonl'], default='json',
+                    help='json 在最后写出一个数组，jsonl 边生成边写入')
+parser.add_argument('--compression', choices=['gzip', 'zstd'], default=None,
+                    help='压缩 --output_format jsonl 的输出（zstd 需要 zstandard 包）')
 
 
 args = parser.parse_args()
 
-# 重新加载 feature_pairs
-with open(args.feature_pairs_file, 'r') as file:
-    feature_pairs = [line.strip() for line in file.readlines()]
+# 所有随机选择都使用这个随机状态，固定 --seed 时输出可以复现
+rng = random.Random(args.seed)
 
-# 设置全局 feature_pairs 供 mapping.py 使用
+# 加载特征对库（特征对只拆分一次，并建立冲突图），供 mapping.py 使用
 import mapping
-mapping.feature_pairs = feature_pairs
+mapping.load_feature_pairs(args.feature_pairs_file)
 
-# 从目录中读取矩阵文件列表
+# 从目录中读取矩阵文件列表，或者直接采样矩阵（适用于无法枚举的大形状）
 import glob
-matrix_files = glob.glob(os.path.join(args.selected_matrixes_dir, "*.json"))
-if not matrix_files:
-    raise ValueError(f"在目录 {args.selected_matrixes_dir} 中没有找到JSON文件")
+sampler = None
+matrix_store = None
+if args.sample_shape:
+    rows, cols = (int(x) for x in args.sample_shape.split('x'))
+    sampler = CanonicalSampler((rows, cols), seed=args.seed)
+    matrix_files = []
+    print(f"从 {sampler.count()} 个 {args.sample_shape} canonical 矩阵中均匀采样")
+elif args.matrix_store:
+    matrix_store = MatrixStore(args.matrix_store)
+    matrix_files = []
+    print(f"矩阵库中共有 {matrix_store.count()} 个矩阵")
+else:
+    if args.selected_matrixes_dir is None:
+        raise ValueError("需要 --selected_matrixes_dir、--sample_shape 或 --matrix_store")
+    # 排序后 --seed 的选择与文件系统的列出顺序无关
+    matrix_files = sorted(glob.glob(os.path.join(args.selected_matrixes_dir, "*.json")))
+    if not matrix_files:
+        raise ValueError(f"在目录 {args.selected_matrixes_dir} 中没有找到JSON文件")
 
-print(f"找到 {len(matrix_files)} 个矩阵文件")
+    print(f"找到 {len(matrix_files)} 个矩阵文件")
 # 全局变量
 feature_pairs = []
+# 已读取的矩阵文件，每个文件只解析一次
+loaded_matrix_files = {}
 
 
-def generate_referent_set(matrix_files):
+def select_matrix(matrix_files, rng):
+    # 采样模式：直接采样一个 canonical 矩阵
+    if sampler is not None:
+        return sampler.sample()
+
+    # 矩阵库：按 id 直接读取一个随机矩阵
+    if matrix_store is not None:
+        return matrix_store.sample(rng, by_group=True)['matrix']
+
     # 随机选择一个矩阵文件
-    selected_file = random.choice(matrix_files)
+    selected_file = rng.choice(matrix_files)
     
-    # 读取矩阵文件
-    with open(selected_file, 'r') as file:
-        matrixes_data = json.load(file)
+    # 读取矩阵文件（只在第一次用到时解析）
+    if selected_file not in loaded_matrix_files:
+        with open(selected_file, 'r') as file:
+            loaded_matrix_files[selected_file] = json.load(file)
+    matrixes_data = loaded_matrix_files[selected_file]
     
     # 确认数据格式：JSON数组，每个元素是矩阵对象
     if not isinstance(matrixes_data, list):
         raise ValueError(f"期望JSON数组格式，但得到 {type(matrixes_data)}")
     
     # 随机选择一个矩阵对象
-    selected_matrix_obj = random.choice(matrixes_data)
+    selected_matrix_obj = rng.choice(matrixes_data)
     
     # 提取矩阵数据
-    matrix_data = selected_matrix_obj['matrix']
+    return selected_matrix_obj['matrix']
+
+def generate_referent_set(matrix_files, rng):
+    matrix_data = select_matrix(matrix_files, rng)
     
     # 调用mapping.py中的函数，生成referent set
-    referent_set = MatrixMapping(matrix_data).mapping_to_referent_set()
+    referent_set = MatrixMapping(matrix_data).mapping_to_referent_ids(rng=rng)
     
-    # 将特征列表转换为字符串格式
+    # 将特征id数组转换为字符串格式（只在输出时转换）
+    vocabulary = mapping.feature_vocabulary()
     referent_set_strings = []
     for referent in referent_set:
-        # 将特征列表用空格连接成字符串
-        referent_string = " ".join(referent)
+        # 将特征词语用空格连接成字符串
+        referent_string = vocabulary.render(referent)
         referent_set_strings.append(referent_string)
     
     # 返回包含referent_set和target_referent的字典
@@ -70,33 +112,34 @@ def generate_referent_set(matrix_files):
     return result
 
 def save_referent_sets(all_referent_sets, output_dir):
-    # 保存所有referent set到一个文件
-    with open(os.path.join(output_dir, 'referent_sets.json'), 'w') as file:
-        json.dump(all_referent_sets, file, indent=2, ensure_ascii=False)
+    """保存所有referent set（任意可迭代对象）到一个文件，返回文件路径"""
+    if args.output_format == 'json':
+        output_path = os.path.join(output_dir, 'referent_sets.json')
+        with open(output_path, 'w') as file:
+            json.dump(list(all_referent_sets), file, indent=2, ensure_ascii=False)
+        return output_path
+
+    # jsonl: 每生成一个就写入一行
+    output_path = with_codec_suffix(os.path.join(output_dir, 'referent_sets.jsonl'), args.compression)
+    with JSONLWriter(output_path) as writer:
+        writer.write_all(all_referent_sets)
+    return output_path
+
+def iter_referent_sets(repeat, rng):
+    # 重复生成referent set
+    for i in range(repeat):
+        print(f"\n=== 第 {i+1} 次生成 ===")
+        yield generate_referent_set(matrix_files, rng)
+        print(f"Generated {i+1} referent sets")
 
 def main():
     # 创建输出目录
     os.makedirs(args.output_dir, exist_ok=True)
     
-    # 收集所有对话链条
-    all_referent_sets = []
-    
-    # 重复生成对话链条
-    for i in range(args.repeat):
-        print(f"\n=== 第 {i+1} 次生成 ===")
-        
-        # 生成对话链条
-        referent_set = generate_referent_set(matrix_files)
-        
-        # 添加到列表中
-        all_referent_sets.append(referent_set)
-        
-        print(f"Generated {i+1} referent sets")
-    
-    # 保存所有对话链条到一个文件
-    save_referent_sets(all_referent_sets, args.output_dir)
+    # 边生成边保存到一个文件
+    output_path = save_referent_sets(iter_referent_sets(args.repeat, rng), args.output_dir)
     
-    print(f"\nDone! Generated {args.repeat} referent sets, saved to {args.output_dir}/referent_sets.json")
+    print(f"\nDone! Generated {args.repeat} referent sets, saved to {output_path}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules import their siblings by name, like the scripts do
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "matrixes"))
+sys.path.append(os.path.join(ROOT, "dialogs", "golden_dialogs"))
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from chain_cache import ChainCache, words_match_structure
+from generate_dialogs import GoldenDialogsGenerator
+from rsa_engine import np
+
+
+def random_matrices(count=200, seed=0):
+    """distinct 0/1 rows, the first one all 1s like the canonical matrices"""
+    rng = random.Random(seed)
+    matrices = []
+    for _ in range(count):
+        rows, cols = rng.choice([(4, 3), (6, 4), (8, 5), (12, 7)])
+        masks = [2**cols - 1] + rng.sample(range(2**cols - 1), rows - 1)
+        matrices.append([[(mask >> (cols - 1 - j)) & 1 for j in range(cols)] for mask in masks])
+    return matrices
+
+
+def words_of(matrix, rng, shared=False):
+    """referent list with one word per (column, value); with shared, two columns share the word of 1"""
+    cols = len(matrix[0])
+    words = [[f"w{j}a", f"w{j}b"] for j in range(cols)]
+    rng.shuffle(words)
+    if shared:
+        words[1][1] = words[0][1]
+    return [[words[j][value] for j, value in enumerate(row)] for row in matrix]
+
+
+def test_cached_dialogues_match_the_generator():
+    rng = random.Random(1)
+    cache = ChainCache()
+    matrices = random_matrices()
+    for matrix in matrices + matrices:
+        referent_list = words_of(matrix, rng)
+        target_index = rng.randrange(len(matrix))
+        expected = GoldenDialogsGenerator(referent_list, target_index).generate_dialogue()
+        assert cache.generate_dialogue(matrix, referent_list, target_index) == expected
+        assert cache.generate_all_dialogues(matrix, referent_list) == [
+            GoldenDialogsGenerator(referent_list, t).generate_dialogue()
+            for t in range(len(matrix))
+        ]
+    assert cache.hits > 0
+
+
+def test_shared_words_are_solved_directly():
+    rng = random.Random(2)
+    cache = ChainCache()
+    for matrix in random_matrices(count=50, seed=3):
+        referent_list = words_of(matrix, rng, shared=True)
+        assert not words_match_structure(matrix, referent_list)
+        expected = GoldenDialogsGenerator(referent_list, 0).generate_dialogue()
+        assert cache.generate_dialogue(matrix, referent_list, 0) == expected
+    assert cache.hits == cache.misses == 0
+
+
+def test_persisted_chains_are_reused(tmp_path):
+    path = str(tmp_path / "chains.db")
+    matrices = random_matrices(count=50, seed=4)
+    cache = ChainCache(path=path)
+    chains = [cache.solve(matrix, 0) for matrix in matrices]
+    cache.close()
+
+    cache = ChainCache(maxsize=10, path=path)
+    assert [cache.solve(matrix, 0) for matrix in matrices] == chains
+    assert cache.misses == 0
+    assert len(cache.chains) == 10
+    cache.close()
+
+
+@pytest.mark.skipif(np is None, reason="the recursive RSA speaker needs numpy")
+def test_strategy_chains_match_the_generator():
+    from recursive_rsa import RecursiveRSA
+
+    rng = random.Random(5)
+    strategy = RecursiveRSA(depth=2, alpha=2.0)
+    cache = ChainCache(strategy=strategy)
+    for matrix in random_matrices(count=50, seed=6):
+        referent_list = words_of(matrix, rng)
+        expected = GoldenDialogsGenerator(referent_list, 0, strategy=strategy).generate_dialogue()
+        assert cache.generate_dialogue(matrix, referent_list, 0) == expected
+        assert cache.make_key(matrix, 0).endswith(f":{strategy.name}")
@@ -0,0 +1,71 @@
+import json
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+PIPELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "matrixes", "golden_dialog_pipeline.py"
+)
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < 80:
+        words.add("".join(rng.choice(letters) for _ in range(5)))
+    words = sorted(words)
+    bank = tmp_path / "feature_pairs.txt"
+    bank.write_text("".join(f"{a} / {b}\n" for a, b in zip(words[::2], words[1::2])))
+
+    # generate_dataset samples 20 matrices of a 3round file
+    matrix_dir = tmp_path / "matrixes"
+    matrix_dir.mkdir()
+    matrices = []
+    for i in range(25):
+        masks = [15] + rng.sample(range(15), 5)
+        matrix = [[(mask >> (3 - j)) & 1 for j in range(4)] for mask in masks]
+        matrices.append({"matrix_name": f"matrix{i}", "matrix": matrix})
+    (matrix_dir / "m_3round.json").write_text(json.dumps(matrices))
+    return tmp_path, bank, matrix_dir
+
+
+def run_pipeline(inputs, name, *options, output="eval_dialog_chains.json"):
+    tmp_path, bank, matrix_dir = inputs
+    output_dir = tmp_path / name
+    subprocess.run(
+        [
+            sys.executable,
+            PIPELINE,
+            "--feature_pairs_file", str(bank),
+            "--selected_matrixes_dir", str(matrix_dir),
+            "--output_dir", str(output_dir),
+            *options,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return (output_dir / output).read_bytes()
+
+
+@pytest.mark.parametrize("options", [(), ("--batch",)])
+def test_output_does_not_depend_on_workers(inputs, options):
+    single = run_pipeline(inputs, "single", "--workers", "1", *options)
+    assert len(json.loads(single)) == 20 * 128
+    assert run_pipeline(inputs, "parallel", "--workers", "2", *options) == single
+
+
+def test_output_depends_on_seed(inputs):
+    assert run_pipeline(inputs, "seed42") != run_pipeline(inputs, "seed7", "--seed", "7")
+
+
+def test_jsonl_output_has_the_json_chains(inputs):
+    chains = json.loads(run_pipeline(inputs, "json"))
+    lines = run_pipeline(
+        inputs, "jsonl", "--output_format", "jsonl", output="eval_dialog_chains.jsonl"
+    ).decode("utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == chains
@@ -0,0 +1,22 @@
+from matrix_generator import MatrixGenerator, compare_with_fast_fixed_first_row
+
+
+def test_orderly_matches_fast_up_to_6x5():
+    results = compare_with_fast_fixed_first_row((6, 5))
+    assert results
+    assert [r["shape"] for r in results if not r["same"]] == []
+
+
+def test_orderly_packed_matches_unpacked():
+    generator = MatrixGenerator((5, 4))
+    matrices = generator.generate_canonical_orderly()
+    packed = generator.generate_canonical_orderly(packed=True)
+    assert [generator.codec.decode(code) for code in packed] == matrices
+
+
+def test_sharded_enumeration_matches_single_process():
+    for shape in [(5, 4), (6, 4), (4, 5)]:
+        expected = MatrixGenerator(shape).generate_canonical_orderly()
+        assert MatrixGenerator(shape).generate_canonical_orderly(workers=2) == expected
+        assert MatrixGenerator(shape).generate_canonical_orderly(workers=3) == expected
+        assert MatrixGenerator(shape).generate_canonical_fast_fixed_first_row(workers=2) == expected
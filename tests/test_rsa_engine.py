@@ -0,0 +1,86 @@
+import random
+from collections import Counter
+
+import pytest
+
+from benchmark_listener import synthetic_referent_set
+from rsa_engine import ArrayRSAEngine, RSAEngine, engine_for_all_referents, np
+
+
+class BaselineSpeaker:
+    """The speaker before the engines: every probability recomputed from the frequencies"""
+
+    def __init__(self, referent_list, target_index):
+        self.referent_list = referent_list
+        self.target_index = target_index
+
+    def likelihood(self, feature, index):
+        referent = self.referent_list[index]
+        if feature not in referent:
+            return 0.0
+        freq = Counter(f for r in self.referent_list for f in r)
+        return (1 / freq[feature]) / sum(1 / freq[f] for f in referent)
+
+    def posterior(self, feature, index):
+        prior = 1 / len(self.referent_list)
+        likelihoods = [self.likelihood(feature, j) for j in range(len(self.referent_list))]
+        return self.likelihood(feature, index) * prior / (sum(likelihoods) * prior)
+
+    def posterior_list(self, feature):
+        return [self.posterior(feature, i) for i in range(len(self.referent_list))]
+
+    def target_rank(self, feature):
+        posteriors = self.posterior_list(feature)
+        target = posteriors[self.target_index]
+        rank = sorted(set(posteriors), reverse=True).index(target) + 1
+        same_count = posteriors.count(target)
+        return float(f"{rank}.{same_count}") if same_count > 1 else float(rank)
+
+    def first_ranked_target_feature(self):
+        target = self.referent_list[self.target_index]
+        ranks = [self.target_rank(f) for f in target]
+        return target[ranks.index(min(ranks))]
+
+
+def referent_sets(count=80, seed=0):
+    rng = random.Random(seed)
+    shapes = [(3, 2), (4, 3), (6, 4), (8, 5), (12, 7)]
+    return [synthetic_referent_set(*rng.choice(shapes), rng) for _ in range(count)]
+
+
+ENGINES = [RSAEngine]
+if np is not None:
+    ENGINES.append(ArrayRSAEngine)
+
+
+@pytest.mark.parametrize("engine_class", ENGINES)
+def test_engine_matches_baseline_speaker(engine_class):
+    for referent_list in referent_sets():
+        engine = engine_class(referent_list)
+        for target_index in range(len(referent_list)):
+            baseline = BaselineSpeaker(referent_list, target_index)
+            for feature in referent_list[target_index]:
+                assert engine.posterior_column(feature) == baseline.posterior_list(feature)
+                assert engine.rank_column(feature)[target_index] == baseline.target_rank(feature)
+        assert engine.first_ranked_features() == [
+            BaselineSpeaker(referent_list, i).first_ranked_target_feature()
+            for i in range(len(referent_list))
+        ]
+
+
+@pytest.mark.skipif(np is None, reason="needs numpy")
+def test_array_engine_matches_engine():
+    for referent_list in referent_sets(count=500, seed=1):
+        engine = RSAEngine(referent_list)
+        array_engine = ArrayRSAEngine(referent_list)
+        for feature in engine.freq:
+            assert array_engine.likelihood_column(feature) == engine.likelihood_column(feature)
+            assert array_engine.rank_column(feature) == engine.rank_column(feature)
+        assert array_engine.first_ranked_features() == engine.first_ranked_features()
+
+
+def test_engine_for_all_referents():
+    referent_list = referent_sets(count=1)[0]
+    engine = engine_for_all_referents(referent_list)
+    assert isinstance(engine, ArrayRSAEngine if np is not None else RSAEngine)
+    assert engine.first_ranked_features() == RSAEngine(referent_list).first_ranked_features()
@@ -0,0 +1,65 @@
+import random
+
+from benchmark_listener import synthetic_referent_set
+from generate_dialogs import GoldenDialogsGenerator
+from rsa_engine import RSAEngine
+from rsa_state import RSAState, iter_rows
+
+
+def per_subset_chain(referent_list, target_index, max_rounds=10):
+    """The chain before RSAState: a new RSAEngine on the remaining referents every round"""
+    indices = list(range(len(referent_list)))
+    chain = []
+    while len(chain) < max_rounds:
+        subset = [referent_list[i] for i in indices]
+        engine = RSAEngine(subset)
+        target_position = indices.index(target_index)
+        feature_position = engine.first_ranked_target_position(target_position)
+        best_feature = subset[target_position][feature_position]
+        kept = [
+            indices[p] for p, f in enumerate(engine.first_ranked_features()) if f == best_feature
+        ]
+        chain.append((feature_position, tuple(kept)))
+        if len(kept) == 1 or target_index not in kept:
+            break
+        indices = kept
+    return tuple(chain)
+
+
+def referent_sets(count=300, seed=0):
+    rng = random.Random(seed)
+    shapes = [(4, 3), (6, 4), (8, 5), (12, 7), (16, 10)]
+    return [synthetic_referent_set(*rng.choice(shapes), rng) for _ in range(count)]
+
+
+def test_chains_match_per_subset_engines():
+    for referent_list in referent_sets():
+        for target_index in range(len(referent_list)):
+            generator = GoldenDialogsGenerator(referent_list, target_index)
+            assert generator.solve_chain() == per_subset_chain(referent_list, target_index)
+
+
+def test_all_chains_match_single_chains():
+    for referent_list in referent_sets(count=100, seed=1):
+        chains = GoldenDialogsGenerator(referent_list, 0).solve_all_chains()
+        assert chains == [
+            GoldenDialogsGenerator(referent_list, t).solve_chain()
+            for t in range(len(referent_list))
+        ]
+
+
+def test_filtered_state_matches_engine_on_the_subset():
+    rng = random.Random(2)
+    for referent_list in referent_sets(count=100, seed=3):
+        state = RSAState(referent_list)
+        mask = state.alive
+        while bin(mask).count("1") > 2:
+            mask &= ~(1 << rng.choice(list(iter_rows(mask))))
+            state.filter(mask)
+            rows = state.rows()
+            engine = RSAEngine([referent_list[i] for i in rows])
+            features = engine.first_ranked_features()
+            assert state.first_ranked_features() == list(zip(rows, features))
+            for heard in set(features):
+                kept = [i for i, f in zip(rows, features) if f == heard]
+                assert list(iter_rows(state.listener_mask(heard))) == kept